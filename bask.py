@@ -2,18 +2,31 @@ import asyncio
 import random
 from aiogram import Router, F
 from aiogram.types import Message
-from database import get_balance, add_balance, get_currency_symbol, get_emoji_by_slot
+from database import get_balance, try_debit, get_currency_symbol, get_emoji_by_slot, JournalEntry, journal_settle
+from sessions import register
 
 router = Router()
 
-# Словарь для хранения состояния игр (антифлуд)
+# Словарь для хранения состояния игр (антифлуд): есть ключ - идет бросок
 active_games = {}
+THROW_TTL = 60  # флаг зависшего броска снимается чистильщиком
+
+throw_sessions = register("баскет", THROW_TTL, active_games)
 
 
 def get_mention(user_id, name):
     return f'<a href="tg://user?id={user_id}">{name}</a>'
 
 
+def basket_multiplier(result_val: int, rng=random) -> float:
+    """Множитель броска по значению кубика 1-5: 4 и 5 - попадание, остальное - промах (0)"""
+    if result_val < 4:
+        return 0.0
+    if result_val == 5:
+        return 2.0
+    return round(rng.uniform(1.4, 1.9), 1)
+
+
 @router.message(F.text.lower().startswith("баскет"))
 async def play_basket(message: Message):
     user_id = message.from_user.id
@@ -28,31 +41,30 @@ async def play_basket(message: Message):
     if len(parts) < 2:
         return await message.answer("Введите сумму ставки или 'вб'. Пример: баскет 100")
 
-    current_balance = await get_balance(user_id)
-
     # Логика "вб" (все в банк) или число
     if parts[1] == "вб":
-        bet = current_balance
+        bet = await get_balance(user_id)
+        if bet <= 0:
+            return await message.answer("❌ У вас нулевой баланс.")
     elif parts[1].isdigit():
         bet = int(parts[1])
     else:
         return await message.answer("Сумма ставки должна быть числом или 'вб'.")
 
     if bet <= 0:
-        if current_balance <= 0 and parts[1] == "вб":
-            return await message.answer("❌ У вас нулевой баланс.")
         return await message.answer("Ставка должна быть больше 0.")
 
-    if current_balance < bet:
+    # Проверка и списание ставки одним запросом (ставка в журнале до итога броска)
+    entry = JournalEntry("basket", "throw", {"chat": chat_id})
+    ok, _ = await try_debit(user_id, bet, journal=entry)
+    if not ok:
         return await message.answer("❌ Недостаточно средств.")
 
     # Блокируем создание новых бросков для юзера
     active_games[(chat_id, user_id)] = True
+    throw_sessions.touch((chat_id, user_id))
 
     try:
-        # Списываем ставку
-        await add_balance(user_id, -bet)
-
         # Отправляем кубик баскетбола
         basket_msg = await message.answer_dice(emoji="🏀")
 
@@ -67,7 +79,8 @@ async def play_basket(message: Message):
         lose_emoji = await get_emoji_by_slot(4)  # Эмодзи проигрыша
         mention = get_mention(user_id, message.from_user.first_name)
 
-        is_win = result_val >= 4
+        multiplier = basket_multiplier(result_val)
+        is_win = multiplier > 0
         win_amount = 0
         status_text = "промах"
         result_icon = lose_emoji
@@ -75,13 +88,8 @@ async def play_basket(message: Message):
         if is_win:
             status_text = "попал"
             result_icon = win_emoji
-            if result_val == 5:
-                multiplier = 2.0
-            else:
-                multiplier = round(random.uniform(1.4, 1.9), 1)
-
             win_amount = int(bet * multiplier)
-            await add_balance(user_id, win_amount)
+        await journal_settle([entry.id], [(user_id, win_amount)])
 
         # Форматирование чисел
         f_bet = f"{bet:,}".replace(',', ' ')
@@ -98,4 +106,4 @@ async def play_basket(message: Message):
 
     finally:
         # Снимаем блокировку
-        active_games[(chat_id, user_id)] = False
+        active_games.pop((chat_id, user_id), None)
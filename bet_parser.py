@@ -0,0 +1,108 @@
+import re
+from functools import lru_cache
+
+from roulette_engine import KIND_RED, KIND_BLACK, number_kind, range_kind
+
+MAX_BETS_PER_MESSAGE = 100
+MAX_MULTIPLIER = 100
+PARSE_CACHE_SIZE = 4096
+
+
+def _build_tokens():
+    """Все «простые» токены разбираются одним поиском по словарю: цвета, числа и диапазоны в обе стороны"""
+    tokens = {}
+    for alias in ("к", "красное", "red"):
+        tokens[alias] = (KIND_RED,)
+    for alias in ("ч", "черное", "black"):
+        tokens[alias] = (KIND_BLACK,)
+    for alias in ("з", "зеленое", "zero", "0"):
+        tokens[alias] = (number_kind(0),)
+    for n in range(1, 37):
+        tokens[str(n)] = (number_kind(n),)
+    for a in range(37):
+        for b in range(37):
+            tokens[f"{a}-{b}"] = (range_kind(min(a, b), max(a, b)),)
+    return tokens
+
+
+_TOKENS = _build_tokens()
+
+# Редкие формы: множитель (x3, х3), сплит через / (7/17/27) и числа с ведущими нулями
+# Цифры только ASCII: \d и str.isdigit() пропускают "²" и "٣", на которых int() падает или читает не то
+_MULTIPLIER_RE = re.compile(r"[xх]([0-9]{1,3})")
+_SPLIT_RE = re.compile(r"[0-9]{1,2}(?:/[0-9]{1,2})+")
+_RANGE_RE = re.compile(r"([0-9]+)-([0-9]+)")
+_NUMBER_RE = re.compile(r"[0-9]+")
+
+
+def _token_kinds(token):
+    """Коды видов ставок для токена; пустой кортеж - токен не ставка"""
+    kinds = _TOKENS.get(token)
+    if kinds is not None:
+        return kinds
+    if _SPLIT_RE.fullmatch(token):
+        # Сплит - одна и та же сумма на каждое из перечисленных чисел
+        kinds = []
+        for part in token.split("/"):
+            n = int(part)
+            if not 1 <= n <= 36:
+                return ()
+            kinds.append(number_kind(n))
+        return tuple(kinds)
+    m = _RANGE_RE.fullmatch(token)
+    if m:
+        s, e = sorted((int(m.group(1)), int(m.group(2))))
+        return (range_kind(s, e),) if e <= 36 else ()
+    if _NUMBER_RE.fullmatch(token):
+        n = int(token)
+        return (number_kind(n),) if 1 <= n <= 36 else ()
+    return ()
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(text):
+    tokens = text.split()
+    if len(tokens) < 2 or not _NUMBER_RE.fullmatch(tokens[0]):
+        return None
+    amount = int(tokens[0])
+    if amount <= 0:
+        return None
+
+    args = tokens[1:]
+    truncated = len(args) > MAX_BETS_PER_MESSAGE
+    if truncated:
+        args = args[:MAX_BETS_PER_MESSAGE]
+
+    multiplier = 1
+    kinds = []
+    for token in args:
+        m = _MULTIPLIER_RE.fullmatch(token)
+        if m:
+            multiplier = int(m.group(1))
+            continue
+        # Непонятные токены (например "привет") просто пропускаются
+        kinds.extend(_token_kinds(token))
+
+    if not kinds or not 1 <= multiplier <= MAX_MULTIPLIER:
+        return None
+    if len(kinds) > MAX_BETS_PER_MESSAGE:
+        kinds, truncated = kinds[:MAX_BETS_PER_MESSAGE], True
+    amount *= multiplier
+    return tuple((kind, amount) for kind in kinds), truncated
+
+
+def parse_bet_line(text):
+    """Разбирает строку ставки вида "500 к 1-12 7/17/27 x3".
+
+    Возвращает (ставки, обрезано) или None, если ставок в строке нет.
+    Ставки - кортеж пар (kind, amount), одинаковые строки разбираются один раз.
+    """
+    # Не ставка - отказ сразу, без lower() и похода в кэш
+    if not "0" <= text[:1] <= "9":
+        return None
+    return _parse(text.lower())
+
+
+def scale_bets(bets, multiplier):
+    """Ставки в нормальной форме с суммами, умноженными на multiplier (повтор/удвоение)"""
+    return [(kind, amount * multiplier) for kind, amount in bets]
@@ -1,104 +1,718 @@
+import asyncio
+import logging
+import time
 import aiosqlite
 import json
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
 from datetime import datetime
+from leaderboard import Leaderboard
+from roulette_stats import SpinStats
 
 DB_PATH = '/app/data/game_base.db'
+READERS_COUNT = 4  # Сколько соединений держим под чтение
+WRITE_FLUSH_INTERVAL = 0.02  # Сколько секунд копим изменения перед записью
+WRITE_MAX_BATCH = 500  # Максимум операций в одной транзакции
+USER_CACHE_SIZE = 50000  # Сколько юзеров держим в кэше
+USER_CACHE_TTL = 600  # Через сколько секунд запись кэша перечитывается из базы
+GAME_LOG_BUFFER_SIZE = 10  # Сколько последних результатов рулетки держим в памяти на чат
+GAME_LOG_KEEP_PER_CHAT = 1000  # Сколько последних спинов чата не трогает сжатие логов
+GAME_LOG_RETENTION_DAYS = 7  # Спины старше этого (и вне последних KEEP) сворачиваются в дневные итоги
+SQLITE_MAX_INT = 2 ** 63 - 1  # Больше INTEGER в SQLite не вмещает: такую ставку все равно не покрыть
+
+
+# --- ПУЛ СОЕДИНЕНИЙ ---
+
+class ConnectionPool:
+    """Постоянные соединения с базой: один писатель и несколько читателей (WAL)"""
+
+    def __init__(self, path: str, readers: int = READERS_COUNT):
+        self.path = path
+        self.readers_count = readers
+        self._writer = None
+        self._write_lock = asyncio.Lock()
+        self._readers = asyncio.Queue()
+        self._all = []
+
+    async def _connect(self, synchronous="NORMAL"):
+        db = await aiosqlite.connect(self.path)
+        db.row_factory = aiosqlite.Row
+        await db.execute("PRAGMA journal_mode=WAL")
+        await db.execute(f"PRAGMA synchronous={synchronous}")
+        await db.execute("PRAGMA busy_timeout=5000")
+        self._all.append(db)
+        return db
+
+    async def open(self):
+        if self._writer is not None:
+            return
+        # Писатель открывается первым: он переводит файл в режим WAL.
+        # FULL: каждый commit сбрасывается на диск (fsync WAL) - переживает и падение ОС, и отключение питания.
+        # Батчи очереди записи делают этот fsync один на такт, а не на каждое изменение
+        self._writer = await self._connect("FULL")
+        for _ in range(self.readers_count):
+            self._readers.put_nowait(await self._connect())
+
+    async def close(self):
+        for db in self._all:
+            await db.close()
+        self._all.clear()
+        self._writer = None
+        self._readers = asyncio.Queue()
+
+    @asynccontextmanager
+    async def read(self):
+        if self._writer is None:
+            raise RuntimeError("Пул соединений не открыт, сначала вызовите init_db()")
+        db = await self._readers.get()
+        try:
+            yield db
+        finally:
+            self._readers.put_nowait(db)
+
+    @asynccontextmanager
+    async def write(self):
+        """Одна транзакция на писателе: commit на выходе, rollback при ошибке"""
+        if self._writer is None:
+            raise RuntimeError("Пул соединений не открыт, сначала вызовите init_db()")
+        async with self._write_lock:
+            try:
+                yield self._writer
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            await self._writer.commit()
+
+
+pool = ConnectionPool(DB_PATH)
+
+
+# --- ОЧЕРЕДЬ ЗАПИСИ ---
+
+class WriteQueue:
+    """Отложенная запись: копит изменения и применяет их одной транзакцией за такт"""
+
+    def __init__(self, flush_interval: float = WRITE_FLUSH_INTERVAL, max_batch: int = WRITE_MAX_BATCH):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._queue = asyncio.Queue()
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Пустой элемент - сигнал дописать остаток и завершиться
+        if self._task is not None:
+            self._queue.put_nowait(None)
+            await self._task
+            self._task = None
+
+    def submit(self, op, wait: bool = True):
+        """op - async-функция от соединения. Если wait, возвращает future с её результатом"""
+        fut = asyncio.get_running_loop().create_future() if wait else None
+        self._queue.put_nowait((op, fut))
+        return fut
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.flush_interval)
+
+            batch = [item]
+            stopping = False
+            while len(batch) < self.max_batch and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            await self._apply(batch)
+            if stopping:
+                # Всё, что успели положить после сигнала остановки, тоже записываем
+                while not self._queue.empty():
+                    rest = self._queue.get_nowait()
+                    if rest is not None:
+                        await self._apply([rest])
+                return
+
+    async def _apply(self, batch):
+        # Очередь одна, операции применяются строго по порядку - порядок по каждому юзеру сохраняется
+        done = []
+        try:
+            async with pool.write() as db:
+                if not db.in_transaction:
+                    # IMMEDIATE сразу берет блокировку записи: чтение+запись внутри операции атомарны
+                    # даже если с базой работает несколько процессов
+                    await db.execute("BEGIN IMMEDIATE")
+                for op, fut in batch:
+                    # Точка сохранения на каждую операцию: ошибка одной не откатывает остальные
+                    await db.execute("SAVEPOINT write_op")
+                    try:
+                        result = await op(db)
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO write_op")
+                        await db.execute("RELEASE write_op")
+                        if fut is None:
+                            logging.exception("Ошибка отложенной записи")
+                        elif not fut.done():
+                            fut.set_exception(e)
+                        continue
+                    await db.execute("RELEASE write_op")
+                    done.append((fut, result))
+        except Exception as e:
+            logging.exception("Не удалось записать пачку изменений")
+            for _, fut in batch:
+                if fut is not None and not fut.done():
+                    fut.set_exception(e)
+            return
+
+        # Результаты отдаем только после commit: писатель в synchronous=FULL, значит WAL уже сброшен на диск
+        for fut, result in done:
+            if fut is not None and not fut.done():
+                fut.set_result(result)
+
+
+write_queue = WriteQueue()
+
+
+async def queue_write(sql, params=(), wait: bool = True):
+    """Один запрос через очередь записи. wait=False - не ждать commit"""
+    async def op(db):
+        await db.execute(sql, params)
+
+    fut = write_queue.submit(op, wait)
+    if fut is not None:
+        await fut
+
+
+# --- КЭШ ЮЗЕРОВ ---
+
+class UserCache:
+    """LRU-кэш с TTL: зарегистрирован ли юзер, забанен ли он и под каким именем записан"""
+
+    def __init__(self, maxsize: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # user_id -> (истекает в, is_banned, (username, full_name))
+
+    def get(self, user_id):
+        """Возвращает is_banned или None, если юзера нет в кэше"""
+        entry = self._data.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[user_id]
+            self.misses += 1
+            return None
+        self._data.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id, is_banned, names=None):
+        self._data[user_id] = (time.monotonic() + self.ttl, int(is_banned), names)
+        self._data.move_to_end(user_id)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def set_banned(self, user_id, is_banned):
+        # Обновляем только существующую запись, TTL не продлеваем
+        entry = self._data.get(user_id)
+        if entry is not None:
+            self._data[user_id] = (entry[0], int(is_banned), entry[2])
+
+    def names(self, user_id):
+        entry = self._data.get(user_id)
+        return entry[2] if entry is not None else None
+
+    def set_names(self, user_id, names):
+        entry = self._data.get(user_id)
+        if entry is not None:
+            self._data[user_id] = (entry[0], entry[1], names)
+
+    def invalidate(self, user_id):
+        self._data.pop(user_id, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+user_cache = UserCache()
+
+# Рейтинг по балансу: грузится при старте и обновляется вместе с каждым изменением баланса
+leaderboard = Leaderboard()
+
+
+# --- ИСТОРИЯ РУЛЕТКИ В ПАМЯТИ ---
+
+class GameHistory:
+    """Последние результаты рулетки по чатам: кольцевой буфер фиксированного размера"""
+
+    def __init__(self, size: int = GAME_LOG_BUFFER_SIZE):
+        self.size = size
+        self._chats = {}  # chat_id -> deque[(win_number, win_color)]
+
+    def append(self, chat_id, win_number, win_color):
+        buffer = self._chats.get(chat_id)
+        if buffer is None:
+            buffer = self._chats[chat_id] = deque(maxlen=self.size)
+        buffer.append((win_number, win_color))
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Таблица пользователей
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                full_name TEXT,
-                balance INTEGER DEFAULT 0,
-                reg_date TEXT,
-                is_banned INTEGER DEFAULT 0,
-                last_bonus TEXT DEFAULT '0'
-            )
-        ''')
+    def load(self, rows):
+        """rows - (chat_id, win_number, win_color) в хронологическом порядке"""
+        self._chats.clear()
+        for chat_id, win_number, win_color in rows:
+            self.append(chat_id, win_number, win_color)
 
-        # Таблица переводов
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS transfers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                from_user_id INTEGER,
-                from_user_name TEXT,
-                to_user_id INTEGER,
-                to_user_name TEXT,
-                amount INTEGER,
-                timestamp TEXT
-            )
-        ''')
+    def recent(self, chat_id):
+        """Последние результаты, новые первыми"""
+        buffer = self._chats.get(chat_id)
+        return list(reversed(buffer)) if buffer else []
+
+
+game_history = GameHistory()
+spin_stats = SpinStats()
+
+
+async def close_db():
+    await write_queue.stop()
+    await pool.close()
+
+
+# --- МИГРАЦИИ СХЕМЫ ---
+# Версия схемы хранится в PRAGMA user_version. Миграции выполняются один раз при старте,
+# каждая в своей транзакции. Новые миграции добавляются только в конец списка.
+
+async def _add_column_if_missing(db, table, column, declaration):
+    async with db.execute(f"PRAGMA table_info({table})") as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    if column not in columns:
+        await db.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+async def _migration_1_tables(db):
+    # Таблица пользователей
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            balance INTEGER DEFAULT 0,
+            reg_date TEXT,
+            is_banned INTEGER DEFAULT 0,
+            last_bonus TEXT DEFAULT '0'
+        )
+    ''')
+
+    # Таблица переводов
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS transfers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id INTEGER,
+            from_user_name TEXT,
+            to_user_id INTEGER,
+            to_user_name TEXT,
+            amount INTEGER,
+            timestamp TEXT
+        )
+    ''')
+
+    # Таблица логов рулетки
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS game_logs (
+            chat_id INTEGER,
+            win_number INTEGER,
+            win_color TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
 
-        # НОВОЕ: Таблица логов рулетки
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS game_logs (
-                chat_id INTEGER,
-                win_number INTEGER,
-                win_color TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    # Таблица последних ставок (для кнопок Повторить/Удвоить)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS last_bets (
+            user_id INTEGER PRIMARY KEY,
+            bets_data TEXT
+        )
+    ''')
 
-        # НОВОЕ: Таблица последних ставок (для кнопок Повторить/Удвоить)
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS last_bets (
-                user_id INTEGER PRIMARY KEY,
-                bets_data TEXT
-            )
-        ''')
+    # Настройки чатов (включены ли игры)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS chat_settings (
+            chat_id INTEGER PRIMARY KEY,
+            games_enabled INTEGER DEFAULT 1
+        )
+    ''')
 
-        # НОВОЕ: Настройки чатов (включены ли игры)
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS chat_settings (
-                chat_id INTEGER PRIMARY KEY,
-                games_enabled INTEGER DEFAULT 1
-            )
-        ''')
+    # Дневная статистика выигрышей
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            user_id INTEGER PRIMARY KEY,
+            win_amount INTEGER DEFAULT 0
+        )
+    ''')
+
+    # Настройки бота (символ валюты, эмодзи тапа)
+    await db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
+
+    # Кастомные эмодзи по слотам
+    await db.execute("CREATE TABLE IF NOT EXISTS custom_emojis (slot INTEGER PRIMARY KEY, emoji_text TEXT)")
+
+    # Донаты
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS donations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            charge_id TEXT,
+            cron_amount INTEGER,
+            stars_amount INTEGER,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Фильтры чатов (антиссылки и т.п.)
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS chat_filters (
+            chat_id INTEGER,
+            filter_type TEXT,
+            value INTEGER,
+            PRIMARY KEY (chat_id, filter_type)
+        )
+    ''')
+
+    # История банов
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS ban_history (
+            user_id INTEGER PRIMARY KEY,
+            user_name TEXT,
+            admin_id INTEGER,
+            admin_name TEXT,
+            duration TEXT,
+            ban_date DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
 
-        # НОВОЕ: Дневная статистика выигрышей
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS daily_stats (
-                user_id INTEGER PRIMARY KEY,
-                win_amount INTEGER DEFAULT 0
-            )
-        ''')
 
-        await db.commit()
+async def _migration_2_user_columns(db):
+    # Старые базы создавались без этих колонок (раньше это делал patch_db)
+    await _add_column_if_missing(db, "users", "is_banned", "INTEGER DEFAULT 0")
+    await _add_column_if_missing(db, "users", "last_bonus", "TEXT DEFAULT '0'")
 
 
-async def patch_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Список запросов для обновления базы без потери данных
-        patches = [
-            "ALTER TABLE users ADD COLUMN is_banned INTEGER DEFAULT 0",
-            "ALTER TABLE users ADD COLUMN last_bonus TEXT DEFAULT '0'"
-        ]
-        for query in patches:
-            try:
-                await db.execute(query)
-            except:
-                pass  # Если колонка уже есть
-        await db.commit()
+async def _migration_3_indexes(db):
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_transfers_from ON transfers (from_user_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_transfers_to ON transfers (to_user_id)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_game_logs_chat_time ON game_logs (chat_id, timestamp)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_username ON users (username)")
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_users_balance ON users (balance)")
+
+
+async def _migration_4_users_fts(db):
+    # Триграммный полнотекстовый индекс по именам: подстроки и префиксы ищутся по индексу.
+    # Таблица внешнего содержимого - сами строки хранятся только в users
+    await db.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5(
+            username, full_name,
+            content='users', content_rowid='user_id',
+            tokenize='trigram'
+        )
+    ''')
+    await _create_users_fts_triggers(db)
+    await db.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+
+
+async def _create_users_fts_triggers(db):
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN
+            INSERT INTO users_fts (rowid, username, full_name) VALUES (new.user_id, new.username, new.full_name);
+        END
+    ''')
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username, full_name)
+            VALUES ('delete', old.user_id, old.username, old.full_name);
+        END
+    ''')
+    # Только по смене имен: изменения баланса индекс не трогают
+    await db.execute('''
+        CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF username, full_name ON users BEGIN
+            INSERT INTO users_fts (users_fts, rowid, username, full_name)
+            VALUES ('delete', old.user_id, old.username, old.full_name);
+            INSERT INTO users_fts (rowid, username, full_name) VALUES (new.user_id, new.username, new.full_name);
+        END
+    ''')
+
+
+def _to_epoch(value):
+    """Старые строковые даты ('%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M', '%d.%m.%Y') -> секунды epoch"""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    for fmt in ("%d.%m.%Y %H:%M:%S", "%d.%m.%Y %H:%M", "%d.%m.%Y"):
+        try:
+            return int(datetime.strptime(value, fmt).timestamp())
+        except ValueError:
+            continue
+    return None
+
+
+async def _migration_5_epoch_times(db):
+    # Тип колонки в SQLite не поменять, а TEXT-колонка превратит числа обратно в строки,
+    # поэтому users и transfers пересобираются с INTEGER-колонками времени
+    await db.create_function("to_epoch", 1, _to_epoch, deterministic=True)
+
+    await db.execute('''
+        CREATE TABLE users_new (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            balance INTEGER DEFAULT 0,
+            reg_date INTEGER,
+            is_banned INTEGER DEFAULT 0,
+            last_bonus INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    await db.execute('''
+        INSERT INTO users_new (user_id, username, full_name, balance, reg_date, is_banned, last_bonus)
+        SELECT user_id, username, full_name, balance, to_epoch(reg_date), is_banned,
+               COALESCE(to_epoch(last_bonus), 0)
+        FROM users
+    ''')
+    await db.execute("DROP TABLE users")
+    await db.execute("ALTER TABLE users_new RENAME TO users")
+    await db.execute("CREATE INDEX idx_users_username ON users (username)")
+    await db.execute("CREATE INDEX idx_users_balance ON users (balance)")
+    await db.execute("CREATE INDEX idx_users_last_bonus ON users (last_bonus)")
+    await db.execute("CREATE INDEX idx_users_reg_date ON users (reg_date)")
+    # Триггеры поиска удалились вместе со старой таблицей
+    await _create_users_fts_triggers(db)
+    await db.execute("INSERT INTO users_fts (users_fts) VALUES ('rebuild')")
+
+    await db.execute('''
+        CREATE TABLE transfers_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id INTEGER,
+            from_user_name TEXT,
+            to_user_id INTEGER,
+            to_user_name TEXT,
+            amount INTEGER,
+            timestamp INTEGER
+        )
+    ''')
+    await db.execute('''
+        INSERT INTO transfers_new (id, from_user_id, from_user_name, to_user_id, to_user_name, amount, timestamp)
+        SELECT id, from_user_id, from_user_name, to_user_id, to_user_name, amount, to_epoch(timestamp)
+        FROM transfers
+    ''')
+    await db.execute("DROP TABLE transfers")
+    await db.execute("ALTER TABLE transfers_new RENAME TO transfers")
+    await db.execute("CREATE INDEX idx_transfers_from ON transfers (from_user_id)")
+    await db.execute("CREATE INDEX idx_transfers_to ON transfers (to_user_id)")
+    await db.execute("CREATE INDEX idx_transfers_time ON transfers (timestamp)")
+
+
+async def _migration_6_game_log_daily(db):
+    # Дневные итоги рулетки по чатам: сюда сворачиваются старые строки game_logs
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS game_log_daily (
+            chat_id INTEGER,
+            day TEXT,
+            spins INTEGER DEFAULT 0,
+            red INTEGER DEFAULT 0,
+            black INTEGER DEFAULT 0,
+            zero INTEGER DEFAULT 0,
+            PRIMARY KEY (chat_id, day)
+        )
+    ''')
+
+
+async def _migration_7_fair_chains(db):
+    # Цепочки хешей для честной рулетки; seed раскрывает все исходы цепочки, наружу не отдается
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS fair_chains (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            seed BLOB,
+            anchor TEXT,
+            length INTEGER,
+            used INTEGER DEFAULT 0,
+            created INTEGER
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_fair_chains_chat ON fair_chains (chat_id, id)")
+    # Каждый спин хранит раскрытый хеш и цепочку, по которой его можно проверить
+    await _add_column_if_missing(db, "game_logs", "chain_id", "INTEGER")
+    await _add_column_if_missing(db, "game_logs", "proof", "TEXT")
+
+
+async def _migration_8_game_journal(db):
+    # Журнал незавершенных игр: ставка пишется вместе со списанием, итог удаляет ее вместе с зачислением.
+    # Строка без ref - начало игры (amount - удержанная ставка), с ref - ход этой игры
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS game_journal (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game TEXT,
+            ref INTEGER,
+            event TEXT,
+            user_id INTEGER,
+            amount INTEGER DEFAULT 0,
+            data TEXT
+        )
+    ''')
+    await db.execute("CREATE INDEX IF NOT EXISTS idx_game_journal_ref ON game_journal (ref)")
+
+
+async def _migration_9_spin_ids(db):
+    # Номер спина - публичный id для «проверка N»: явный AUTOINCREMENT, VACUUM и сжатие логов его не сдвинут.
+    # Доказательства спинов переезжают в spin_proofs - сжатие логов эту таблицу не трогает
+    await db.execute('''
+        CREATE TABLE IF NOT EXISTS spin_proofs (
+            spin_id INTEGER PRIMARY KEY,
+            chat_id INTEGER,
+            win_number INTEGER,
+            win_color TEXT,
+            chain_id INTEGER,
+            proof TEXT
+        )
+    ''')
+    await db.execute('''
+        INSERT OR IGNORE INTO spin_proofs (spin_id, chat_id, win_number, win_color, chain_id, proof)
+        SELECT rowid, chat_id, win_number, win_color, chain_id, proof FROM game_logs WHERE proof IS NOT NULL
+    ''')
+    await db.execute('''
+        CREATE TABLE game_logs_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER,
+            win_number INTEGER,
+            win_color TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    await db.execute('''
+        INSERT INTO game_logs_new (id, chat_id, win_number, win_color, timestamp)
+        SELECT rowid, chat_id, win_number, win_color, timestamp FROM game_logs
+    ''')
+    # Номера уже удаленных сжатием спинов тоже не должны достаться новым
+    await db.execute("DELETE FROM sqlite_sequence WHERE name = 'game_logs_new'")
+    await db.execute('''
+        INSERT INTO sqlite_sequence (name, seq)
+        SELECT 'game_logs_new', MAX(COALESCE((SELECT MAX(id) FROM game_logs_new), 0),
+                                    COALESCE((SELECT MAX(spin_id) FROM spin_proofs), 0))
+    ''')
+    await db.execute("DROP TABLE game_logs")
+    await db.execute("ALTER TABLE game_logs_new RENAME TO game_logs")
+    await db.execute("CREATE INDEX idx_game_logs_chat_time ON game_logs (chat_id, timestamp)")
+
+
+# Версия схемы = позиция миграции в списке (начиная с 1)
+MIGRATIONS = [
+    _migration_1_tables,
+    _migration_2_user_columns,
+    _migration_3_indexes,
+    _migration_4_users_fts,
+    _migration_5_epoch_times,
+    _migration_6_game_log_daily,
+    _migration_7_fair_chains,
+    _migration_8_game_journal,
+    _migration_9_spin_ids,
+]
+
+
+async def get_schema_version():
+    async with pool.read() as db:
+        async with db.execute("PRAGMA user_version") as cursor:
+            return (await cursor.fetchone())[0]
+
+
+async def run_migrations():
+    current = await get_schema_version()
+    for version, migration in enumerate(MIGRATIONS, start=1):
+        if version <= current:
+            continue
+        async with pool.write() as db:
+            # Явный BEGIN: DDL в sqlite3 сам транзакцию не открывает
+            await db.execute("BEGIN IMMEDIATE")
+            await migration(db)
+            await db.execute(f"PRAGMA user_version = {version}")
+        logging.info(f"Схема базы обновлена до версии {version} ({migration.__name__})")
+
+
+async def init_db():
+    await pool.open()
+    write_queue.start()
+    await run_migrations()
+    await settings_registry.load()
+    await load_leaderboard()
+    await load_game_history()
+    await load_spin_stats()
+
 
 # --- ФУНКЦИИ ПОЛЬЗОВАТЕЛЕЙ ---
 
 async def check_user(user_id, username, full_name):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT user_id FROM users WHERE user_id = ?", (user_id,)) as cursor:
-            user = await cursor.fetchone()
-            if not user:
-                await db.execute(
-                    "INSERT INTO users (user_id, username, full_name, reg_date) VALUES (?, ?, ?, ?)",
-                    (user_id, username, full_name, datetime.now().strftime("%d.%m.%Y"))
-                )
-                await db.commit()
+    names = (username, full_name)
+    # Известный юзер - ни одного запроса к базе (пишем, только если он сменил имя)
+    if user_cache.get(user_id) is not None:
+        if user_cache.names(user_id) != names:
+            await update_user_names(user_id, username, full_name)
+        return
+    # Проверяем через читателя, чтобы не занимать писателя на каждое сообщение
+    async with pool.read() as db:
+        async with db.execute("SELECT is_banned, username, full_name FROM users WHERE user_id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+    if row:
+        user_cache.put(user_id, row[0] or 0, (row[1], row[2]))
+        # Имена в базе обновляются, чтобы поиск по ним был актуальным
+        if (row[1], row[2]) != names:
+            await update_user_names(user_id, username, full_name)
+        return
+    async with pool.write() as db:
+        await db.execute(
+            "INSERT OR IGNORE INTO users (user_id, username, full_name, reg_date) VALUES (?, ?, ?, ?)",
+            (user_id, username, full_name, int(time.time()))
+        )
+    user_cache.put(user_id, 0, names)
+    if user_id not in leaderboard:
+        leaderboard.set(user_id, 0)
+
+async def is_user_banned(user_id):
+    is_banned = user_cache.get(user_id)
+    if is_banned is not None:
+        return bool(is_banned)
+    async with pool.read() as db:
+        async with db.execute("SELECT is_banned FROM users WHERE user_id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+    if not row:
+        return False
+    user_cache.put(user_id, row[0] or 0)
+    return bool(row[0])
+
+async def update_user_names(user_id, username, full_name):
+    # Поисковый индекс users_fts обновляется триггером на это UPDATE
+    async with pool.write() as db:
+        await db.execute(
+            "UPDATE users SET username = ?, full_name = ? WHERE user_id = ?",
+            (username, full_name, user_id)
+        )
+    user_cache.set_names(user_id, (username, full_name))
 
 async def get_user_data(user_id):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with pool.read() as db:
         async with db.execute("SELECT * FROM users WHERE user_id = ?", (user_id,)) as cursor:
             return await cursor.fetchone()
 
@@ -109,27 +723,63 @@ async def get_balance(user_id):
 
 # --- РАЗДЕЛ БОНУСОВ ---
 
+BONUS_AMOUNT = 5000
+BONUS_COOLDOWN = 24 * 60 * 60  # Секунд между бонусами
+
 async def get_last_bonus(user_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    """Время последнего бонуса в секундах epoch"""
+    async with pool.read() as db:
         async with db.execute("SELECT last_bonus FROM users WHERE user_id = ?", (user_id,)) as cursor:
             row = await cursor.fetchone()
-            # Возвращаем '0' если юзера нет или он еще не брал бонус
-            return row[0] if row and row[0] is not None else '0'
-
-async def update_bonus_time(user_id, time_str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Проверяем, существует ли пользователь, прежде чем обновлять
-        # Это предотвратит ошибки логики
-        await db.execute(
-            "UPDATE users SET last_bonus = ?, balance = balance + 5000 WHERE user_id = ?",
-            (time_str, user_id)
-        )
-        await db.commit()
+            # Возвращаем 0 если юзера нет или он еще не брал бонус
+            return row[0] if row and row[0] else 0
+
+def bonus_wait_seconds(last_bonus, now=None):
+    """Сколько секунд осталось до следующего бонуса (0 - можно забирать)"""
+    if now is None:
+        now = int(time.time())
+    return max(0, (last_bonus or 0) + BONUS_COOLDOWN - now)
+
+async def claim_bonus(user_id):
+    """Выдает бонус, если кулдаун прошел. Проверка - одно сравнение чисел в UPDATE,
+    поэтому два одновременных нажатия не дадут бонус дважды.
+    Возвращает (выдан ли, баланс, сколько секунд ждать)"""
+    now = int(time.time())
+
+    async def op(db):
+        async with db.execute(
+            "UPDATE users SET last_bonus = ?, balance = balance + ? "
+            "WHERE user_id = ? AND last_bonus <= ? RETURNING balance",
+            (now, BONUS_AMOUNT, user_id, now - BONUS_COOLDOWN)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row:
+            return True, row[0], 0
+        async with db.execute("SELECT balance, last_bonus FROM users WHERE user_id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+        if not row:
+            return False, 0, 0
+        return False, row[0], bonus_wait_seconds(row[1], now)
+
+    claimed, balance, wait = await write_queue.submit(op)
+    if claimed:
+        leaderboard.add(user_id, BONUS_AMOUNT)
+    return claimed, balance, wait
+
+async def count_bonus_ready():
+    """Сколько игроков могут забрать бонус прямо сейчас (диапазон по индексу last_bonus)"""
+    async with pool.read() as db:
+        async with db.execute(
+            "SELECT COUNT(*) FROM users WHERE last_bonus <= ?",
+            (int(time.time()) - BONUS_COOLDOWN,)
+        ) as cursor:
+            return (await cursor.fetchone())[0]
 
 # --- ФУНКЦИИ ПЕРЕВОДОВ ---
 
 async def make_transfer(from_id, to_id, from_name, to_name, amount):
-    async with aiosqlite.connect(DB_PATH) as db:
+    # Идет через очередь, чтобы видеть все ранее поставленные начисления
+    async def op(db):
         async with db.execute("SELECT balance FROM users WHERE user_id = ?", (from_id,)) as cursor:
             row = await cursor.fetchone()
             if not row or row[0] < amount:
@@ -138,17 +788,30 @@ async def make_transfer(from_id, to_id, from_name, to_name, amount):
         await db.execute("UPDATE users SET balance = balance - ? WHERE user_id = ?", (amount, from_id))
         await db.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (amount, to_id))
 
-        dt_string = datetime.now().strftime("%d.%m.%Y %H:%M")
         await db.execute(
             "INSERT INTO transfers (from_user_id, from_user_name, to_user_id, to_user_name, amount, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-            (from_id, from_name, to_id, to_name, amount, dt_string)
+            (from_id, from_name, to_id, to_name, amount, int(time.time()))
         )
-        await db.commit()
         return True
 
+    success = await write_queue.submit(op)
+    if success:
+        leaderboard.add(from_id, -amount)
+        leaderboard.add(to_id, amount)
+    return success
+
+async def get_transfers_stats(seconds: int = 3600):
+    """Количество и сумма переводов за последние seconds секунд"""
+    async with pool.read() as db:
+        async with db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM transfers WHERE timestamp >= ?",
+            (int(time.time()) - seconds,)
+        ) as cursor:
+            count, total = await cursor.fetchone()
+            return count, total
+
 async def get_history(user_id):
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with pool.read() as db:
         async with db.execute("""
             SELECT * FROM transfers 
             WHERE from_user_id = ? OR to_user_id = ? 
@@ -160,273 +823,508 @@ async def get_history(user_id):
 
 # --- ФУНКЦИИ РУЛЕТКИ ---
 
-async def save_last_bet(user_id, bets):
-    async with aiosqlite.connect(DB_PATH) as db:
-        data = json.dumps(bets)
-        await db.execute("INSERT OR REPLACE INTO last_bets (user_id, bets_data) VALUES (?, ?)", (user_id, data))
-        await db.commit()
+async def save_last_bet(user_id, bets, wait: bool = True):
+    data = json.dumps(bets)
+    await queue_write("INSERT OR REPLACE INTO last_bets (user_id, bets_data) VALUES (?, ?)", (user_id, data), wait)
 
 async def get_last_bet(user_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.read() as db:
         async with db.execute("SELECT bets_data FROM last_bets WHERE user_id = ?", (user_id,)) as cursor:
             row = await cursor.fetchone()
             return json.loads(row[0]) if row else None
 
-async def add_game_log(chat_id, win_num, win_color):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("INSERT INTO game_logs (chat_id, win_number, win_color) VALUES (?, ?, ?)",
-                         (chat_id, win_num, win_color))
-        await db.commit()
+async def add_game_log(chat_id, win_num, win_color, wait: bool = True):
+    # В память - сразу, на диск - пачкой через очередь записи
+    game_history.append(chat_id, win_num, win_color)
+    spin_stats.record(chat_id, win_num, win_color)
+    await queue_write("INSERT INTO game_logs (chat_id, win_number, win_color) VALUES (?, ?, ?)",
+                      (chat_id, win_num, win_color), wait)
+
+async def load_game_history():
+    # Одним запросом берем последние GAME_LOG_BUFFER_SIZE спинов каждого чата
+    async with pool.read() as db:
+        async with db.execute('''
+            SELECT chat_id, win_number, win_color FROM (
+                SELECT chat_id, win_number, win_color, rowid AS rid,
+                       ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY rowid DESC) AS rn
+                FROM game_logs
+            )
+            WHERE rn <= ?
+            ORDER BY chat_id, rid
+        ''', (game_history.size,)) as cursor:
+            game_history.load(await cursor.fetchall())
+
+async def load_spin_stats():
+    # Один потоковый проход по game_logs: строки не собираются в список целиком
+    spin_stats.clear()
+    async with pool.read() as db:
+        async with db.execute("SELECT chat_id, win_number, win_color FROM game_logs ORDER BY rowid") as cursor:
+            async for chat_id, win_number, win_color in cursor:
+                spin_stats.record(chat_id, win_number, win_color)
 
 async def get_game_logs(chat_id):
-    async with aiosqlite.connect(DB_PATH) as db:
-        async with db.execute("SELECT win_number, win_color FROM game_logs WHERE chat_id = ? ORDER BY timestamp DESC LIMIT 10", (chat_id,)) as cursor:
-            return await cursor.fetchall()
+    # Команда "лог" на диск не ходит
+    return game_history.recent(chat_id)
+
+async def compact_game_logs(keep_per_chat: int = GAME_LOG_KEEP_PER_CHAT,
+                            retention_days: int = GAME_LOG_RETENTION_DAYS):
+    """Сворачивает старые спины в дневные итоги game_log_daily и удаляет их из game_logs.
+    Последние keep_per_chat спинов каждого чата не трогаются. Возвращает число свернутых строк"""
+    async def op(db):
+        await db.execute("CREATE TEMP TABLE IF NOT EXISTS compact_rowids (rid INTEGER PRIMARY KEY)")
+        await db.execute("DELETE FROM compact_rowids")
+        await db.execute('''
+            INSERT INTO compact_rowids (rid)
+            SELECT rid FROM (
+                SELECT rowid AS rid, timestamp,
+                       ROW_NUMBER() OVER (PARTITION BY chat_id ORDER BY rowid DESC) AS rn
+                FROM game_logs
+            )
+            WHERE rn > ? AND timestamp < datetime('now', ?)
+        ''', (keep_per_chat, f"-{retention_days} days"))
+        await db.execute('''
+            INSERT INTO game_log_daily (chat_id, day, spins, red, black, zero)
+            SELECT chat_id, date(timestamp), COUNT(*),
+                   SUM(win_color = '🔴'), SUM(win_color = '⚫'), SUM(win_number = 0)
+            FROM game_logs
+            WHERE rowid IN (SELECT rid FROM compact_rowids)
+            GROUP BY chat_id, date(timestamp)
+            ON CONFLICT (chat_id, day) DO UPDATE SET
+                spins = spins + excluded.spins,
+                red = red + excluded.red,
+                black = black + excluded.black,
+                zero = zero + excluded.zero
+        ''')
+        async with db.execute("DELETE FROM game_logs WHERE rowid IN (SELECT rid FROM compact_rowids)") as cursor:
+            return cursor.rowcount
+
+    compacted = await write_queue.submit(op)
+    if compacted:
+        logging.info(f"Логи рулетки: свернуто {compacted} строк в дневные итоги")
+    return compacted
 
 async def is_games_enabled(chat_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.read() as db:
         async with db.execute("SELECT games_enabled FROM chat_settings WHERE chat_id = ?", (chat_id,)) as cursor:
             row = await cursor.fetchone()
             return row[0] == 1 if row else True
 
-async def add_daily_win(user_id, amount):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            INSERT INTO daily_stats (user_id, win_amount) VALUES (?, ?)
-            ON CONFLICT(user_id) DO UPDATE SET win_amount = win_amount + ?
-        ''', (user_id, amount, amount))
-        await db.commit()
+async def add_daily_win(user_id, amount, wait: bool = True):
+    await queue_write('''
+        INSERT INTO daily_stats (user_id, win_amount) VALUES (?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET win_amount = win_amount + ?
+    ''', (user_id, amount, amount), wait)
 
 def get_currency_icon():
     return "cron"
 
+async def settle_round(chat_id, result, payouts, last_bets, proof=None, journal_ids=(), wait: bool = True):
+    """Итоги раунда рулетки одной транзакцией.
+
+    result - (число, цвет), payouts - [(user_id, выигрыш)], last_bets - [(user_id, ставки)],
+    proof - (id цепочки, раскрытый хеш) честного RNG, journal_ids - записи журнала ставок раунда.
+    Лог игры, зачисления, дневные выигрыши и снимки ставок пишутся через executemany.
+    С wait возвращает номер спина (id в game_logs; доказательство - в spin_proofs под тем же номером).
+    """
+    win_num, win_color = result
+    chain_id, proof_hex = proof or (None, None)
+    credits = [(amount, user_id) for user_id, amount in payouts if amount > 0]
+    daily = [(user_id, amount, amount) for amount, user_id in credits]
+    snapshots = [(user_id, json.dumps(bets)) for user_id, bets in last_bets]
+
+    async def op(db):
+        async with db.execute(
+            "INSERT INTO game_logs (chat_id, win_number, win_color) VALUES (?, ?, ?)",
+            (chat_id, win_num, win_color)
+        ) as cursor:
+            spin_id = cursor.lastrowid
+        if proof_hex is not None:
+            await db.execute(
+                "INSERT INTO spin_proofs (spin_id, chat_id, win_number, win_color, chain_id, proof) VALUES (?, ?, ?, ?, ?, ?)",
+                (spin_id, chat_id, win_num, win_color, chain_id, proof_hex)
+            )
+        if credits:
+            await db.executemany("UPDATE users SET balance = balance + ? WHERE user_id = ?", credits)
+            await db.executemany('''
+                INSERT INTO daily_stats (user_id, win_amount) VALUES (?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET win_amount = win_amount + ?
+            ''', daily)
+        if snapshots:
+            await db.executemany("INSERT OR REPLACE INTO last_bets (user_id, bets_data) VALUES (?, ?)", snapshots)
+        await _journal_delete(db, journal_ids)
+        return spin_id
+
+    fut = write_queue.submit(op, wait)
+    spin_id = await fut if fut is not None else None
+
+    # С wait память обновляется только после commit: несостоявшийся раунд не попадает ни в историю, ни в рейтинг
+    game_history.append(chat_id, win_num, win_color)
+    spin_stats.record(chat_id, win_num, win_color)
+    for amount, user_id in credits:
+        leaderboard.add(user_id, amount)
+    return spin_id
+
+async def get_spin(chat_id, spin_id):
+    # Спины с доказательством живут в spin_proofs вечно; в game_logs - только спины до честного RNG
+    async with pool.read() as db:
+        async with db.execute('''
+            SELECT p.spin_id, p.win_number, p.win_color, p.proof,
+                   c.id AS chain_id, c.anchor, c.length
+            FROM spin_proofs p LEFT JOIN fair_chains c ON c.id = p.chain_id
+            WHERE p.spin_id = ? AND p.chat_id = ?
+            UNION ALL
+            SELECT id, win_number, win_color, NULL, NULL, NULL, NULL
+            FROM game_logs
+            WHERE id = ? AND chat_id = ? AND id NOT IN (SELECT spin_id FROM spin_proofs)
+        ''', (spin_id, chat_id, spin_id, chat_id)) as cursor:
+            return await cursor.fetchone()
+
+# --- ЧЕСТНЫЙ RNG ---
+
+async def create_fair_chain(chat_id, seed, anchor, length):
+    async def op(db):
+        async with db.execute(
+            "INSERT INTO fair_chains (chat_id, seed, anchor, length, created) VALUES (?, ?, ?, ?, ?)",
+            (chat_id, seed, anchor, length, int(time.time()))
+        ) as cursor:
+            return cursor.lastrowid
+
+    return await write_queue.submit(op)
+
+async def get_active_fair_chain(chat_id):
+    # Самая старая недоиспользованная цепочка: следующая могла быть подготовлена заранее
+    async with pool.read() as db:
+        async with db.execute(
+            "SELECT id, seed, anchor, length, used FROM fair_chains WHERE chat_id = ? AND used < length ORDER BY id LIMIT 1",
+            (chat_id,)
+        ) as cursor:
+            return await cursor.fetchone()
+
+async def advance_fair_chain(chain_id, used, wait: bool = True):
+    await queue_write("UPDATE fair_chains SET used = ? WHERE id = ?", (used, chain_id), wait)
+
+async def try_debit(user_id, amount, journal=None):
+    """Списывает amount, только если хватает средств. Возвращает (успех, баланс после).
+    journal - JournalEntry: ставка попадает в журнал той же операцией, id записи - в journal.id"""
+    async def op(db):
+        async with db.execute(
+            "UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ? RETURNING balance",
+            (amount, user_id, amount)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row:
+            if journal is not None:
+                await _journal_insert(db, journal, user_id, amount)
+            return True, row[0]
+        async with db.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+        return False, row[0] if row else 0
+
+    if amount <= 0 or amount > SQLITE_MAX_INT:
+        return False, await get_balance(user_id)
+    ok, balance = await write_queue.submit(op)
+    if ok:
+        # Рейтинг двигаем дельтой: так порядок с неждущими начислениями не важен
+        leaderboard.add(user_id, -amount)
+    return ok, balance
+
+async def debit_up_to(user_id, unit, max_units, journal=None):
+    """Списывает столько ставок по unit, сколько хватает (не больше max_units).
+    Возвращает (сколько списано ставок, баланс после). journal - как в try_debit"""
+    async def op(db):
+        async with db.execute("SELECT balance FROM users WHERE user_id = ?", (user_id,)) as cursor:
+            row = await cursor.fetchone()
+        balance = row[0] if row else 0
+        units = min(max_units, balance // unit) if 0 < unit <= SQLITE_MAX_INT else 0
+        if units <= 0:
+            return 0, balance
+        async with db.execute(
+            "UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ? RETURNING balance",
+            (units * unit, user_id, units * unit)
+        ) as cursor:
+            row = await cursor.fetchone()
+        if row and journal is not None:
+            await _journal_insert(db, journal, user_id, units * unit)
+        return (units, row[0]) if row else (0, balance)
+
+    units, balance = await write_queue.submit(op)
+    if units:
+        leaderboard.add(user_id, -units * unit)
+    return units, balance
+
+# --- ЖУРНАЛ ИГР ---
+# Деньги в игре = строки журнала с amount. Пока игра идет, они в журнале; рестарт их не теряет
+
+class JournalEntry:
+    """Начало игры для try_debit/debit_up_to; после успешного списания id - номер записи"""
+
+    __slots__ = ("game", "event", "data", "id")
+
+    def __init__(self, game, event, data=None):
+        self.game = game
+        self.event = event
+        self.data = data
+        self.id = None
+
+
+async def _journal_insert(db, entry, user_id, amount):
+    async with db.execute(
+        "INSERT INTO game_journal (game, event, user_id, amount, data) VALUES (?, ?, ?, ?, ?)",
+        (entry.game, entry.event, user_id, amount, json.dumps(entry.data) if entry.data is not None else None)
+    ) as cursor:
+        entry.id = cursor.lastrowid
+
+
+async def _journal_delete(db, ids):
+    # Вместе с началом игры уходят и все ее ходы
+    if ids:
+        params = [(journal_id, journal_id) for journal_id in ids]
+        await db.executemany("DELETE FROM game_journal WHERE id = ? OR ref = ?", params)
+
+
+async def journal_append(game, ref, event, data=None, wait: bool = False):
+    """Ход игры ref (клик, id сообщения): денег не двигает, поэтому по умолчанию без ожидания"""
+    await queue_write("INSERT INTO game_journal (game, ref, event, data) VALUES (?, ?, ?, ?)",
+                      (game, ref, event, json.dumps(data) if data is not None else None), wait)
+
+
+async def journal_settle(ids, credits=(), wait: bool = True):
+    """Закрывает игры ids в журнале и зачисляет credits [(user_id, сумма)] одной транзакцией"""
+    credits = [(amount, user_id) for user_id, amount in credits if amount > 0]
+
+    async def op(db):
+        if credits:
+            await db.executemany("UPDATE users SET balance = balance + ? WHERE user_id = ?", credits)
+        await _journal_delete(db, ids)
+
+    fut = write_queue.submit(op, wait)
+    if fut is not None:
+        await fut
+
+    # Как в settle_round: с wait рейтинг двигается только после commit
+    for amount, user_id in credits:
+        leaderboard.add(user_id, amount)
+
+
+async def load_journal():
+    """Незавершенные игры после рестарта: {игра: [строки в порядке записи]}.
+    Завершенные игры из журнала удаляются, так что он не больше числа живых игр"""
+    journal = {}
+    async with pool.read() as db:
+        async with db.execute("SELECT id, game, ref, event, user_id, amount, data FROM game_journal ORDER BY id") as cursor:
+            async for row in cursor:
+                journal.setdefault(row["game"], []).append(row)
+    return journal
+
+
+async def refund_journal(rows):
+    """Возвращает игрокам ставки незавершенных игр из rows. Возвращает сумму возврата"""
+    starts = [row for row in rows if row["ref"] is None]
+    refunds = {}
+    for row in starts:
+        refunds[row["user_id"]] = refunds.get(row["user_id"], 0) + row["amount"]
+    # Удаляются все строки: и начала игр, и ходы без начала, если такие остались
+    await journal_settle([row["id"] for row in rows], refunds.items())
+    return sum(refunds.values())
+
+
 # Обертка для рулетки (чтобы не переписывать логику списания)
-async def add_balance(user_id, amount):
-    await set_balance(user_id, amount, mode="add")
+async def add_balance(user_id, amount, wait: bool = True):
+    await set_balance(user_id, amount, mode="add", wait=wait)
 
 # --- АДМИН-ФУНКЦИИ ---
 
-async def set_balance(user_id: int, amount: int, mode="add"):
-    async with aiosqlite.connect(DB_PATH) as db:
-        if mode == "add":
-            await db.execute("UPDATE users SET balance = balance + ? WHERE user_id = ?", (amount, user_id))
-        elif mode == "set":
-            await db.execute("UPDATE users SET balance = ? WHERE user_id = ?", (amount, user_id))
-        await db.commit()
+async def set_balance(user_id: int, amount: int, mode="add", wait: bool = True):
+    if mode == "add":
+        await queue_write("UPDATE users SET balance = balance + ? WHERE user_id = ?", (amount, user_id), wait)
+        leaderboard.add(user_id, amount)
+    elif mode == "set":
+        await queue_write("UPDATE users SET balance = ? WHERE user_id = ?", (amount, user_id), wait)
+        if user_id in leaderboard:
+            leaderboard.set(user_id, amount)
 
 async def set_ban_status(user_id: int, status: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.write() as db:
         await db.execute("UPDATE users SET is_banned = ? WHERE user_id = ?", (status, user_id))
-        await db.commit()
+    user_cache.set_banned(user_id, status)
 
 async def delete_user_by_id(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.write() as db:
         await db.execute("DELETE FROM users WHERE user_id = ?", (user_id,))
-        await db.commit()
+    user_cache.invalidate(user_id)
+    leaderboard.remove(user_id)
 
 async def add_donation(user_id, charge_id, cron_amount, stars_amount):
-    async with aiosqlite.connect(DB_PATH) as db:
-        # Создаем таблицу донатов, если её нет
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS donations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER,
-                charge_id TEXT,
-                cron_amount INTEGER,
-                stars_amount INTEGER,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    async with pool.write() as db:
         await db.execute(
             "INSERT INTO donations (user_id, charge_id, cron_amount, stars_amount) VALUES (?, ?, ?, ?)",
             (user_id, charge_id, cron_amount, stars_amount)
         )
-        await db.commit()
 
 
-async def set_custom_currency(symbol: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS settings 
-            (key TEXT PRIMARY KEY, value TEXT)
-        ''')
-        await db.execute(
-            "INSERT OR REPLACE INTO settings (key, value) VALUES ('currency_symbol', ?)",
-            (symbol,)
-        )
-        await db.commit()
+# --- НАСТРОЙКИ И ЭМОДЗИ (РЕЕСТР В ПАМЯТИ) ---
 
-async def get_currency_symbol():
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            async with db.execute("SELECT value FROM settings WHERE key = 'currency_symbol'") as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else "cron" # По умолчанию
-        except:
-            return "cron"
+DEFAULT_CURRENCY_SYMBOL = "🌕"
+DEFAULT_TAP_EMOJI = "🔘"
+DEFAULT_SLOT_EMOJI = "👋"  # Если слот пустой, вернет обычную руку
 
 
+class SettingsRegistry:
+    """Статичные настройки в памяти: читаются один раз при старте, setters пишут насквозь"""
 
-async def set_tap_emoji(symbol: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
-        await db.execute(
-            "INSERT OR REPLACE INTO settings (key, value) VALUES ('tap_emoji', ?)",
-            (symbol,)
-        )
-        await db.commit()
+    def __init__(self):
+        self.settings = {}  # key -> value из таблицы settings
+        self.emojis = {}  # slot -> emoji_text из таблицы custom_emojis
 
-async def get_tap_emoji():
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            async with db.execute("SELECT value FROM settings WHERE key = 'tap_emoji'") as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else "🔘" # Смайл по умолчанию
-        except:
-            return "🔘"
+    async def load(self):
+        async with pool.read() as db:
+            async with db.execute("SELECT key, value FROM settings") as cursor:
+                self.settings = {key: value for key, value in await cursor.fetchall()}
+            async with db.execute("SELECT slot, emoji_text FROM custom_emojis") as cursor:
+                self.emojis = {slot: text for slot, text in await cursor.fetchall()}
 
+    async def set(self, key, value):
+        async with pool.write() as db:
+            await db.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)", (key, value))
+        # Память обновляем только после успешной записи
+        self.settings[key] = value
 
+    async def set_emoji(self, slot, text):
+        async with pool.write() as db:
+            await db.execute("INSERT OR REPLACE INTO custom_emojis (slot, emoji_text) VALUES (?, ?)", (slot, text))
+        self.emojis[slot] = text
 
-async def save_custom_emoji(emoji_str: str, slot_number: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS custom_emojis 
-            (slot INTEGER PRIMARY KEY, emoji_text TEXT)
-        ''')
-        await db.execute(
-            "INSERT OR REPLACE INTO custom_emojis (slot, emoji_text) VALUES (?, ?)",
-            (slot_number, emoji_str)
-        )
-        await db.commit()
 
-async def get_all_custom_emojis():
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            async with db.execute("SELECT slot, emoji_text FROM custom_emojis ORDER BY slot ASC") as cursor:
-                return await cursor.fetchall()
-        except:
-            return []
+settings_registry = SettingsRegistry()
 
 
+async def set_custom_currency(symbol: str):
+    await settings_registry.set("currency_symbol", symbol)
 
+async def get_currency_symbol():
+    return settings_registry.settings.get("currency_symbol", DEFAULT_CURRENCY_SYMBOL)
 
-async def get_emoji_by_slot(slot_number: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            async with db.execute("SELECT emoji_text FROM custom_emojis WHERE slot = ?", (slot_number,)) as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else "👋" # Если слот пустой, вернет обычную руку
-        except:
-            return "👋"
+async def set_tap_emoji(symbol: str):
+    await settings_registry.set("tap_emoji", symbol)
 
+async def get_tap_emoji():
+    return settings_registry.settings.get("tap_emoji", DEFAULT_TAP_EMOJI)
 
+async def save_custom_emoji(emoji_str: str, slot_number: int):
+    await settings_registry.set_emoji(slot_number, emoji_str)
 
-# В файле database.py
+async def get_all_custom_emojis():
+    return sorted(settings_registry.emojis.items())
 
-async def get_currency_symbol():
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            # Создаем таблицу настроек, если её вдруг нет
-            await db.execute("CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)")
-            async with db.execute("SELECT value FROM settings WHERE key = 'currency_symbol'") as cursor:
-                row = await cursor.fetchone()
-                # Если в базе что-то есть — возвращаем, если нет — возвращаем стандарт (Луну)
-                return row[0] if row else "🌕"
-        except Exception:
-            return "🌕"
+async def get_emoji_by_slot(slot_number: int):
+    return settings_registry.emojis.get(slot_number, DEFAULT_SLOT_EMOJI)
 
 
 
 async def set_filter(chat_id: int, filter_type: str, value: int):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS chat_filters 
-            (chat_id INTEGER, filter_type TEXT, value INTEGER, PRIMARY KEY (chat_id, filter_type))
-        ''')
+    async with pool.write() as db:
         await db.execute(
             "INSERT OR REPLACE INTO chat_filters (chat_id, filter_type, value) VALUES (?, ?, ?)",
             (chat_id, filter_type, value)
         )
-        await db.commit()
 
 async def get_filter(chat_id: int, filter_type: str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        try:
-            async with db.execute("SELECT value FROM chat_filters WHERE chat_id = ? AND filter_type = ?",
-                                 (chat_id, filter_type)) as cursor:
-                row = await cursor.fetchone()
-                return row[0] if row else 0 # По умолчанию выключено (разрешено)
-        except:
-            return 0
+    async with pool.read() as db:
+        async with db.execute("SELECT value FROM chat_filters WHERE chat_id = ? AND filter_type = ?",
+                             (chat_id, filter_type)) as cursor:
+            row = await cursor.fetchone()
+            return row[0] if row else 0 # По умолчанию выключено (разрешено)
 
 
 
 # --- ФУНКЦИИ ПОИСКА ПОЛЬЗОВАТЕЛЕЙ ---
 
+FTS_MIN_QUERY = 3  # Триграммный индекс ищет строки от 3 символов
+
+
+def _fts_phrase(text: str) -> str:
+    # Запрос пользователя - одна фраза в кавычках, спецсинтаксис FTS5 не срабатывает
+    return '"' + text.replace('"', '""') + '"'
+
 async def find_user_by_username(username: str):
-    """Поиск пользователя по точному юзернейму (без @)"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        # Убираем @ если пользователь его ввел
-        clean_username = username.replace("@", "")
-        async with db.execute("SELECT * FROM users WHERE username = ?", (clean_username,)) as cursor:
+    """Поиск пользователя по точному юзернейму (без @, без учета регистра)"""
+    # Убираем @ если пользователь его ввел
+    clean_username = username.replace("@", "")
+    if len(clean_username) < FTS_MIN_QUERY:
+        return None
+    async with pool.read() as db:
+        # Кандидатов дает индекс users_fts, точное совпадение проверяется на найденных строках
+        async with db.execute('''
+            SELECT u.* FROM users_fts f JOIN users u ON u.user_id = f.rowid
+            WHERE users_fts MATCH ? AND lower(ltrim(u.username, '@')) = lower(?)
+            LIMIT 1
+        ''', (f"username : {_fts_phrase(clean_username)}", clean_username)) as cursor:
             return await cursor.fetchone()
 
 async def search_users_by_name(query: str):
     """Поиск списка пользователей по частичному совпадению имени или юзернейма"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        search_query = f"%{query}%"
-        async with db.execute(
-            "SELECT * FROM users WHERE username LIKE ? OR full_name LIKE ? LIMIT 10",
-            (search_query, search_query)
-        ) as cursor:
+    query = query.strip()
+    if not query:
+        return []
+    async with pool.read() as db:
+        if len(query) < FTS_MIN_QUERY:
+            # Слишком короткий запрос для триграмм - старый поиск перебором
+            search_query = f"%{query}%"
+            async with db.execute(
+                "SELECT * FROM users WHERE username LIKE ? OR full_name LIKE ? LIMIT 10",
+                (search_query, search_query)
+            ) as cursor:
+                return await cursor.fetchall()
+
+        async with db.execute('''
+            SELECT u.* FROM users_fts f JOIN users u ON u.user_id = f.rowid
+            WHERE users_fts MATCH ?
+            ORDER BY f.rank
+            LIMIT 10
+        ''', (_fts_phrase(query),)) as cursor:
             return await cursor.fetchall()
 
 async def get_all_users_count():
     """Получить общее количество игроков в базе"""
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.read() as db:
         async with db.execute("SELECT COUNT(*) FROM users") as cursor:
             row = await cursor.fetchone()
             return row[0] if row else 0
 
+async def load_leaderboard():
+    async with pool.read() as db:
+        async with db.execute("SELECT user_id, balance FROM users") as cursor:
+            leaderboard.load(await cursor.fetchall())
+
 async def get_top_rich(limit: int = 10):
-    """Получить топ богатых игроков"""
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        async with db.execute(
-            "SELECT * FROM users ORDER BY balance DESC LIMIT ?",
-            (limit,)
-        ) as cursor:
-            return await cursor.fetchall()
+    """Получить топ богатых игроков (порядок - из рейтинга в памяти, строки - по первичному ключу)"""
+    top_ids = [user_id for user_id, _ in leaderboard.top(limit)]
+    if not top_ids:
+        return []
+    placeholders = ",".join("?" * len(top_ids))
+    async with pool.read() as db:
+        async with db.execute(f"SELECT * FROM users WHERE user_id IN ({placeholders})", top_ids) as cursor:
+            rows = {row["user_id"]: row for row in await cursor.fetchall()}
+    return [rows[user_id] for user_id in top_ids if user_id in rows]
+
+def get_user_rank(user_id):
+    """(место, всего игроков); место None, если юзера нет в базе"""
+    return leaderboard.rank(user_id), len(leaderboard)
 
 
 
 async def add_to_banlist(user_id, user_name, admin_id, admin_name, duration_str):
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute('''
-            CREATE TABLE IF NOT EXISTS ban_history (
-                user_id INTEGER PRIMARY KEY,
-                user_name TEXT,
-                admin_id INTEGER,
-                admin_name TEXT,
-                duration TEXT,
-                ban_date DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
+    async with pool.write() as db:
         await db.execute(
             "INSERT OR REPLACE INTO ban_history (user_id, user_name, admin_id, admin_name, duration) VALUES (?, ?, ?, ?, ?)",
             (user_id, user_name, admin_id, admin_name, duration_str)
         )
-        await db.commit()
 
 async def get_banlist_data():
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
+    async with pool.read() as db:
         async with db.execute("SELECT * FROM ban_history ORDER BY ban_date DESC") as cursor:
             return await cursor.fetchall()
 
 async def remove_from_banlist(user_id):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.write() as db:
         await db.execute("DELETE FROM ban_history WHERE user_id = ?", (user_id,))
-        await db.commit()
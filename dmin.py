@@ -9,8 +9,11 @@ from database import (
     save_custom_emoji,
     get_all_custom_emojis,
     delete_user_by_id,
-    get_user_data  # Добавил для проверки существования юзера
+    get_user_data,  # Добавил для проверки существования юзера
+    user_cache
 )
+from sessions import session_gauges
+from mines import board_edits
 
 router = Router()
 ADMIN_ID = 621856176
@@ -133,6 +136,30 @@ async def admin_show_emoji_list(message: Message):
     await message.answer(text, parse_mode="HTML")
 
 
+@router.message(F.text.lower() == "кэш")
+async def admin_cache_stats(message: Message):
+    stats = user_cache.stats()
+    await message.answer(
+        f"<b>Кэш юзеров:</b>\n"
+        f"Записей: <b>{stats['size']}</b>\n"
+        f"Попаданий: <b>{stats['hits']}</b>\n"
+        f"Промахов: <b>{stats['misses']}</b>\n"
+        f"Hit rate: <b>{stats['hit_rate']:.1%}</b>",
+        parse_mode="HTML"
+    )
+
+
+@router.message(F.text.lower() == "сессии")
+async def admin_session_stats(message: Message):
+    text = "<b>Живые сессии:</b>\n"
+    for name, (live, locks) in session_gauges().items():
+        text += f"{name}: <b>{live}</b> (замков: {locks})\n"
+    edits = board_edits.stats()
+    text += (f"\nПравки досок мин: отправлено <b>{edits['sent']}</b> из {edits['pushed']} "
+             f"(ждут: {edits['pending']}, потеряно: {edits['dropped']})")
+    await message.answer(text, parse_mode="HTML")
+
+
 @router.message(F.text.lower().startswith("делект"))
 async def admin_delete_user(message: Message):
     # Проверка на админа (если у тебя есть список админов, добавь проверку)
@@ -5,10 +5,14 @@ from aiogram.types import (
     InlineKeyboardMarkup, InlineKeyboardButton
 )
 import database
+from sessions import register
 
 donate_router = Router()
 
 user_invoices = {}
+INVOICE_TTL = 24 * 60 * 60  # неоплаченный счет забывается через сутки
+
+invoice_sessions = register("донат", INVOICE_TTL, user_invoices)
 
 PACKAGES = {
     "buy_25": {"stars": 25, "cron": 50000},
@@ -54,6 +58,7 @@ async def process_buy_callback(callback: CallbackQuery):
     )
 
     user_invoices[callback.from_user.id] = invoice_msg.message_id
+    invoice_sessions.touch(callback.from_user.id)
     await callback.answer()
 
 
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+EDIT_DEBOUNCE = 0.35  # секунд копим клики, прежде чем отправить доску
+
+
+class EditCoalescer:
+    """Склеивает частые правки одного сообщения: уходит только последняя версия после паузы.
+
+    push() не ждет Telegram - состояние игры уже обновлено, доска догонит его одной правкой.
+    Финальную версию (конец игры) отправляет send_now(): отложенная правка выбрасывается,
+    а уже летящая дожидается, чтобы старая доска не легла поверх итога.
+    Флуд-контроль Telegram правку не отменяет: после паузы уходит самая свежая версия.
+    """
+
+    def __init__(self, delay: float = EDIT_DEBOUNCE):
+        self.delay = delay
+        self.pushed = 0
+        self.sent = 0
+        self.dropped = 0  # правки, отвергнутые Telegram: доска осталась старой
+        self._pending = {}  # (chat_id, message_id) -> (text, kwargs) последней версии
+        self._tasks = {}  # (chat_id, message_id) -> задача отправки
+        self._sending = set()  # ключи, по которым запрос уже ушел в Telegram
+
+    def push(self, bot, chat_id, message_id, text, **kwargs):
+        key = (chat_id, message_id)
+        self.pushed += 1
+        self._pending[key] = (text, kwargs)
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._run(bot, key))
+
+    async def send_now(self, bot, chat_id, message_id, text, **kwargs):
+        self.pushed += 1
+        await self.drop(chat_id, message_id)
+        await self._edit(bot, (chat_id, message_id), text, kwargs)
+
+    async def drop(self, chat_id, message_id):
+        """Забывает отложенную правку; если запрос уже в пути - дожидается его"""
+        key = (chat_id, message_id)
+        self._pending.pop(key, None)
+        task = self._tasks.get(key)
+        if task is None:
+            return
+        if key in self._sending:
+            await asyncio.shield(task)
+        else:
+            task.cancel()
+
+    async def _run(self, bot, key):
+        try:
+            while key in self._pending:
+                await asyncio.sleep(self.delay)
+                text, kwargs = self._pending.pop(key, (None, None))
+                if text is None:
+                    break
+                self._sending.add(key)
+                try:
+                    await self._edit(bot, key, text, kwargs)
+                finally:
+                    self._sending.discard(key)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._tasks.pop(key, None)
+
+    async def _edit(self, bot, key, text, kwargs):
+        chat_id, message_id = key
+        while True:
+            try:
+                await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id, **kwargs)
+                self.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                # Флуд-контроль: ждем и повторяем, пока не пройдет - иначе пропадет итоговая доска.
+                # Отправляем ту версию, что окажется последней к этому моменту
+                await asyncio.sleep(e.retry_after)
+                text, kwargs = self._pending.pop(key, (text, kwargs))
+            except TelegramBadRequest as e:
+                if "message is not modified" not in str(e):
+                    self._drop_failed(key, e)
+                return
+            except Exception as e:
+                self._drop_failed(key, e)
+                return
+
+    def _drop_failed(self, key, error):
+        self.dropped += 1
+        logging.warning(f"Правка {key} не прошла, доска осталась старой: {error}")
+
+    def stats(self):
+        return {"pushed": self.pushed, "sent": self.sent, "dropped": self.dropped, "pending": len(self._pending)}
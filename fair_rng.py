@@ -0,0 +1,143 @@
+import asyncio
+import hashlib
+import logging
+import secrets
+
+import database
+
+CHAIN_LENGTH = 1000  # спинов на одну цепочку
+CHAIN_REFILL_AT = 50  # когда в цепочке осталось столько хешей, следующая готовится заранее
+HASH_SIZE = 32
+
+_OUTCOMES = 37
+# Отбраковка: 4-байтные окна выше этого порога дали бы перекос в пользу младших чисел
+_UNBIASED_LIMIT = 2 ** 32 - (2 ** 32 % _OUTCOMES)
+
+
+def build_chain(seed: bytes, length: int = CHAIN_LENGTH):
+    """Обратная цепочка: h0 = seed, h(i+1) = sha256(h(i)).
+
+    Возвращает (хеши h0..h(length-1) одним bytes, якорь sha256(h(length-1))).
+    Якорь публикуется заранее, хеши раскрываются с конца - каждый следующий
+    раскрытый хеш проверяется по предыдущему, а угадать его наперед нельзя.
+    Считается долго, поэтому вызывается только в потоке.
+    """
+    data = bytearray(length * HASH_SIZE)
+    h = seed
+    for i in range(length):
+        data[i * HASH_SIZE:(i + 1) * HASH_SIZE] = h
+        h = hashlib.sha256(h).digest()
+    return bytes(data), h.hex()
+
+
+def outcome(proof: bytes) -> int:
+    """Число 0..36 из раскрытого хеша: первое 4-байтное окно без перекоса по модулю 37"""
+    for i in range(0, HASH_SIZE, 4):
+        value = int.from_bytes(proof[i:i + 4], "big")
+        if value < _UNBIASED_LIMIT:
+            return value % _OUTCOMES
+    return int.from_bytes(proof, "big") % _OUTCOMES
+
+
+def verify(proof_hex: str, anchor_hex: str, length: int = CHAIN_LENGTH):
+    """Номер хеша в цепочке (с 1, от якоря) или None, если хеш к якорю не сходится"""
+    h = bytes.fromhex(proof_hex)
+    for step in range(1, length + 1):
+        h = hashlib.sha256(h).digest()
+        if h.hex() == anchor_hex:
+            return step
+    return None
+
+
+class HashChain:
+    __slots__ = ("id", "anchor", "data", "length", "used")
+
+    def __init__(self, chain_id, anchor, data, length, used=0):
+        self.id = chain_id
+        self.anchor = anchor
+        self.data = data
+        self.length = length
+        self.used = used
+
+    @property
+    def left(self):
+        return self.length - self.used
+
+    def reveal(self) -> bytes:
+        # Раскрываем с конца: h(length-1), h(length-2), ...
+        i = self.length - 1 - self.used
+        self.used += 1
+        return self.data[i * HASH_SIZE:(i + 1) * HASH_SIZE]
+
+
+class FairRNG:
+    """Цепочки хешей по чатам. Спин - срез готовой цепочки, O(1); цепочки строятся в потоке.
+
+    Цепочка создается и пишется в базу в ensure() - при открытии раунда, до ставок.
+    draw() новых цепочек не создает: исход всегда берется из уже зафиксированной.
+    """
+
+    def __init__(self, length: int = CHAIN_LENGTH, refill_at: int = CHAIN_REFILL_AT):
+        self.length = length
+        self.refill_at = refill_at
+        self._current = {}  # chat_id -> HashChain
+        self._prepared = {}  # chat_id -> asyncio.Task со следующей цепочкой
+        self._locks = {}  # chat_id -> asyncio.Lock, только на время смены цепочки
+
+    async def ensure(self, chat_id):
+        """Текущая цепочка чата с неизрасходованными хешами: создается (или поднимается из базы)
+        и записывается заранее. Когда хешей остается мало, так же заранее готовится следующая"""
+        chain = self._current.get(chat_id)
+        if chain is None or not chain.left:
+            async with self._locks.setdefault(chat_id, asyncio.Lock()):
+                chain = self._current.get(chat_id)
+                if chain is None or not chain.left:
+                    chain = self._current[chat_id] = await self._next_chain(chat_id)
+        if chain.left <= self.refill_at and chat_id not in self._prepared:
+            self._prepared[chat_id] = asyncio.create_task(self._create_chain(chat_id))
+        return chain
+
+    async def draw(self, chat_id):
+        """(число, хеш-доказательство hex, id цепочки) для очередного спина чата"""
+        chain = self._current.get(chat_id)
+        if chain is None or not chain.left:
+            async with self._locks.setdefault(chat_id, asyncio.Lock()):
+                chain = self._current.get(chat_id)
+                if chain is None or not chain.left:
+                    # Раунд открылся на последних хешах - берем преемника, записанного еще тогда
+                    task = self._prepared.pop(chat_id, None)
+                    if task is None:
+                        raise RuntimeError(f"У чата {chat_id} нет заранее записанной цепочки")
+                    chain = self._current[chat_id] = await task
+
+        proof = chain.reveal()
+        # Позиция в цепочке пишется в ту же очередь раньше итогов раунда: хеш не раскроется дважды
+        await database.advance_fair_chain(chain.id, chain.used, wait=False)
+        return outcome(proof), proof.hex(), chain.id
+
+    async def commitment(self, chat_id):
+        """(id цепочки, якорь, использовано, длина) текущей цепочки чата; создает ее, если нет"""
+        chain = await self.ensure(chat_id)
+        return chain.id, chain.anchor, chain.used, chain.length
+
+    async def _next_chain(self, chat_id):
+        task = self._prepared.pop(chat_id, None)
+        if task is not None:
+            return await task
+        # После рестарта продолжаем неизрасходованную цепочку, если она есть
+        row = await database.get_active_fair_chain(chat_id)
+        if row:
+            data, anchor = await asyncio.to_thread(build_chain, row["seed"], row["length"])
+            if anchor == row["anchor"]:
+                return HashChain(row["id"], anchor, data, row["length"], row["used"])
+            logging.error(f"Цепочка {row['id']} чата {chat_id} не сходится с якорем, создаю новую")
+        return await self._create_chain(chat_id)
+
+    async def _create_chain(self, chat_id):
+        seed = secrets.token_bytes(HASH_SIZE)
+        data, anchor = await asyncio.to_thread(build_chain, seed, self.length)
+        chain_id = await database.create_fair_chain(chat_id, seed, anchor, self.length)
+        return HashChain(chain_id, anchor, data, self.length)
+
+
+fair_rng = FairRNG()
@@ -1,9 +1,8 @@
 import logging
 from aiogram import Router, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
-from database import get_user_data, get_last_bonus, update_bonus_time
-from datetime import datetime, timedelta
-from database import get_user_data, get_last_bonus, get_currency_symbol # Добавь её сюда
+from database import get_user_data, claim_bonus, bonus_wait_seconds
+from database import get_currency_symbol # Добавь её сюда
 
 router = Router()
 
@@ -32,21 +31,10 @@ async def show_balance(message: Message):
         f"<b>{cur_symbol} баланс: {formatted_balance}</b>"
     )
 
-    # Проверка бонуса
+    # Проверка бонуса: время последнего бонуса уже есть в строке юзера (секунды epoch)
     keyboard = None
-    last_bonus_str = await get_last_bonus(user_id)
-
-    can_get_bonus = False
-    if last_bonus_str == '0':
-        can_get_bonus = True
-    else:
-        try:
-            last_bonus_time = datetime.strptime(last_bonus_str, "%d.%m.%Y %H:%M:%S")
-        except ValueError:
-            last_bonus_time = datetime.strptime(last_bonus_str, "%d.%m.%Y %H:%M")
-
-        if datetime.now() >= last_bonus_time + timedelta(hours=24):
-            can_get_bonus = True
+    last_bonus = user['last_bonus'] if user else 0
+    can_get_bonus = bonus_wait_seconds(last_bonus) == 0
 
     if can_get_bonus:
         keyboard = InlineKeyboardMarkup(inline_keyboard=[
@@ -67,31 +55,13 @@ async def process_bonus_callback(callback: CallbackQuery):
     if user_id != owner_id:
         return await callback.answer("❌ Это не ваша кнопка!", show_alert=True)
 
-    last_bonus_str = await get_last_bonus(user_id)
-    now = datetime.now()
-
-    can_get = False
-    if last_bonus_str == '0':
-        can_get = True
-    else:
-        try:
-            last_bonus_time = datetime.strptime(last_bonus_str, "%d.%m.%Y %H:%M:%S")
-        except ValueError:
-            # На случай, если в базе дата без секунд
-            last_bonus_time = datetime.strptime(last_bonus_str, "%d.%m.%Y %H:%M")
-
-        if now >= last_bonus_time + timedelta(hours=24):
-            can_get = True
+    # Проверка кулдауна и начисление - одним запросом
+    can_get, balance_val, _ = await claim_bonus(user_id)
 
     if can_get:
-        new_time_str = now.strftime("%d.%m.%Y %H:%M:%S")
-        await update_bonus_time(user_id, new_time_str)
-
-        user = await get_user_data(user_id)
         mention = get_mention(user_id, callback.from_user.first_name)
 
         # Форматируем баланс с пробелами: 50000 -> 50 000
-        balance_val = user['balance'] if user else 0
         formatted_balance = f"{balance_val:,}".replace(',', ' ')
 
         # Редактируем сообщение, убирая кнопку
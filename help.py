@@ -37,6 +37,8 @@ HELP_TEXT_CMDS = (
     "<code>б</code> — проверить свой баланс\n"
     "<code>п (сумма)</code> — передать валюту (ответом на сообщение)\n"
     "<code>профиль</code> — просмотр своей анкеты\n"
+    "<code>топ</code> — самые богатые игроки\n"
+    "<code>ранг</code> — ваше место в рейтинге\n"
     "<code>Бонус</code> — получить ежедневную награду"
 )
 
@@ -46,6 +48,7 @@ HELP_TEXT_GAMES_MAIN = "<blockquote>🎮 <b>Выберите игру для п
 TEXT_GAME_MINES = (
     "<blockquote>💣 <b>Игра: Мины</b></blockquote>\n\n"
     "<code>мины (сумма)</code> — начать игру на указанную ставку.\n"
+    "<code>мины (сумма) (бомбы)</code> — то же с 1-24 бомбами (по умолчанию 5): больше бомб — выше множители.\n"
     "<i>После запуска следуйте инструкциям в кнопках.</i>"
 )
 
@@ -59,9 +62,13 @@ TEXT_GAME_BASK = (
 TEXT_GAME_ROULETTE = (
     "<blockquote>🎰 <b>Игра: Рулетка</b></blockquote>\n\n"
     "<code>(сумма) (тип)</code> — сделать ставку (красное/черное/число).\n"
+    "<code>500 к 1-12 7/17/27 x3</code> — несколько ставок сразу: диапазон, числа через /, множитель суммы.\n"
     "<code>го</code> — запустить рулетку.\n"
+    "<code>+автоспин</code> / <code>-автоспин</code> — запуск по таймеру без «го» (для админов).\n"
     "<code>лог</code> — история последних чисел.\n"
-    "<code>ставки</code> — ваши активные ставки."
+    "<code>стата</code> — горячие и холодные числа, серии цветов.\n"
+    "<code>ставки</code> — ваши активные ставки.\n"
+    "<code>честность</code> — якорь цепочки хешей чата, <code>проверка (номер)</code> — проверить спин."
 )
 
 # --- ХЕНДЛЕРЫ ---
@@ -0,0 +1,65 @@
+import bisect
+
+
+class Leaderboard:
+    """Рейтинг по балансу в памяти.
+
+    Ключи (-баланс, user_id) лежат в отсортированном списке: топ и место игрока
+    ищутся бинарным поиском за O(log n).
+    Изменение баланса находит ключ тоже bisect'ом, но удаление и вставка в список -
+    сдвиг хвоста, O(n). Это один memmove указателей: на 100 000 игроков ~15 мкс
+    на изменение, несравнимо дешевле ORDER BY по всей таблице на каждый запрос топа.
+    """
+
+    def __init__(self):
+        self._keys = []  # [(-balance, user_id)] по возрастанию = по убыванию баланса
+        self._balances = {}  # user_id -> balance
+
+    def __len__(self):
+        return len(self._balances)
+
+    def __contains__(self, user_id):
+        return user_id in self._balances
+
+    def load(self, rows):
+        """rows - пары (user_id, balance) из таблицы users"""
+        self._balances = {user_id: balance or 0 for user_id, balance in rows}
+        self._keys = sorted((-balance, user_id) for user_id, balance in self._balances.items())
+
+    def _unlink(self, user_id):
+        balance = self._balances.pop(user_id, None)
+        if balance is None:
+            return
+        key = (-balance, user_id)
+        i = bisect.bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            del self._keys[i]
+
+    def set(self, user_id, balance):
+        self._unlink(user_id)
+        balance = balance or 0
+        self._balances[user_id] = balance
+        bisect.insort(self._keys, (-balance, user_id))
+
+    def add(self, user_id, delta):
+        # UPDATE по несуществующему юзеру в базе ничего не меняет - здесь так же
+        balance = self._balances.get(user_id)
+        if balance is not None and delta:
+            self.set(user_id, balance + delta)
+
+    def remove(self, user_id):
+        self._unlink(user_id)
+
+    def get(self, user_id):
+        return self._balances.get(user_id)
+
+    def top(self, limit: int = 10):
+        """[(user_id, balance)] по убыванию баланса"""
+        return [(user_id, -neg) for neg, user_id in self._keys[:limit]]
+
+    def rank(self, user_id):
+        """Место игрока (с 1) или None, если его нет в рейтинге"""
+        balance = self._balances.get(user_id)
+        if balance is None:
+            return None
+        return bisect.bisect_left(self._keys, (-balance, user_id)) + 1
@@ -5,7 +5,11 @@ from aiogram.types import Message, TelegramObject
 from typing import Callable, Dict, Any, Awaitable
 
 # Импорты БД
-from database import init_db, check_user, get_user_data
+from database import (
+    init_db, close_db, check_user, is_user_banned, compact_game_logs, load_journal, refund_journal
+)
+from mines import restore_games
+from sessions import sweep_sessions, SWEEP_INTERVAL
 
 # Импорты роутеров ОСНОВНОГО БОТА
 from handlers import router
@@ -44,8 +48,8 @@ class GlobalCheckMiddleware(BaseMiddleware):
                 username=event.from_user.username,
                 full_name=event.from_user.full_name
             )
-            user = await get_user_data(event.from_user.id)
-            if user and user['is_banned']:
+            # Для известных юзеров обе проверки отвечают из кэша без запросов к базе
+            if await is_user_banned(event.from_user.id):
                 return
         return await handler(event, data)
 
@@ -56,12 +60,26 @@ async def main():
     # 1. Инициализация общей БД
     await init_db()
 
+    # Незавершенные игры из журнала: доски мин поднимаются, остальные ставки возвращаются игрокам
+    journal = await load_journal()
+    await restore_games(journal.pop("mines", []))
+    refunded = await refund_journal([row for rows in journal.values() for row in rows])
+    if refunded:
+        logging.info(f"Журнал игр: возвращено {refunded} cron по прерванным раундам")
+
     # 2. Запуск планировщика (для системы размутов в основном боте)
     if not scheduler.running:
         scheduler.start()
 
+    # Раз в сутки сворачиваем старые логи рулетки в дневные итоги
+    scheduler.add_job(compact_game_logs, "cron", hour=4, id="compact_game_logs", replace_existing=True)
+
     # --- НАСТРОЙКА ОСНОВНОГО БОТА ---
     main_bot = Bot(token=MAIN_TOKEN)
+
+    # Чистильщик брошенных игр: мины закрываются с выплатой, замки и флаги выселяются
+    scheduler.add_job(sweep_sessions, "interval", seconds=SWEEP_INTERVAL, args=[main_bot],
+                      id="sweep_sessions", replace_existing=True)
     main_dp = Dispatcher()
     main_dp.message.outer_middleware(GlobalCheckMiddleware())
 
@@ -98,6 +116,7 @@ async def main():
         await support_bot.session.close()
         if scheduler.running:
             scheduler.shutdown()
+        await close_db()
 
 
 if __name__ == "__main__":
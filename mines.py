@@ -1,59 +1,198 @@
 import asyncio
+import csv
+import json
+import logging
 import random
 import time
+from fractions import Fraction
+from functools import lru_cache
+from math import comb
 from aiogram import Router, F, Bot
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 import database
+import sessions
+from edits import EditCoalescer
 
 mines_router = Router()
 
 # Хранилище активных игр
 # Ключ: (chat_id, user_id)
-# Значение: {"bet": int, "mines": list, "clicked": list, "active": bool, "msg_id": int}
+# Значение: {"bet": int, "bombs": int, "mines": int, "clicked": int, "active": bool, "msg_id": int, "journal": int}
+# journal - id начала игры в журнале: по нему игра восстанавливается после рестарта
+# mines и clicked - 25-битные маски поля: бит cell_index = 1, если там бомба / клетка открыта
 active_mines = {}
 mine_locks = {}
+# Доска в Telegram догоняет состояние игры: быстрые клики склеиваются в одну правку
+board_edits = EditCoalescer()
 
-BOMBS_COUNT = 5
-
-
-def get_multiplier(hits: int) -> float:
-    if hits == 0:
-        return 1.0
-    mult = 0.95
-    for i in range(hits):
-        safe_tiles = 25 - i
-        safe_choices = 25 - BOMBS_COUNT - i
-        mult *= safe_tiles / safe_choices
-    return round(mult, 2)
-
-
-def get_mines_keyboard(user_id: int, bombs: list, clicked: list, game_over: bool = False):
-    keyboard = []
-    empty_char = "ㅤ"
-
-    for row in range(5):
-        row_buttons = []
-        for col in range(5):
-            cell_index = row * 5 + col
-            if game_over:
-                text = "💣" if cell_index in bombs else empty_char
-                cb_data = "ignore"
-            else:
-                if cell_index in clicked:
-                    text = empty_char
-                    cb_data = "ignore"
-                else:
-                    text = "❓"
-                    cb_data = f"mine_{cell_index}_{user_id}"
-            row_buttons.append(InlineKeyboardButton(text=text, callback_data=cb_data))
-        keyboard.append(row_buttons)
-
-    if not game_over and len(clicked) > 0:
-        keyboard.append([InlineKeyboardButton(text="💸 Забрать выигрыш", callback_data=f"cashout_{user_id}")])
+BOMBS_COUNT = 5  # по умолчанию, если в команде не указано
+MIN_BOMBS, MAX_BOMBS = 1, 24
+FIELD_SIZE = 25
+KEYBOARD_CACHE_SIZE = 8192
+IDLE_TIMEOUT = 30 * 60  # брошенная игра закрывается с выплатой текущего выигрыша
+HOUSE_FACTOR = Fraction(95, 100)
 
+
+def fair_multiplier(bombs: int, hits: int) -> Fraction:
+    """Честный множитель: 1 / P(открыть hits клеток подряд без бомбы) = C(25, hits) / C(25 - bombs, hits)"""
+    return Fraction(comb(FIELD_SIZE, hits), comb(FIELD_SIZE - bombs, hits))
+
+
+def build_multiplier_table(house_factor: Fraction = HOUSE_FACTOR):
+    """{бомбы: (множитель при 0, 1, ... 25-бомбы открытых клетках)}, считается точно в дробях.
+    В игре множитель округляется до сотых, как и раньше"""
+    table = {}
+    for bombs in range(MIN_BOMBS, MAX_BOMBS + 1):
+        row = [1.0]
+        for hits in range(1, FIELD_SIZE - bombs + 1):
+            row.append(float(round(house_factor * fair_multiplier(bombs, hits), 2)))
+        table[bombs] = tuple(row)
+    return table
+
+
+MULTIPLIERS = build_multiplier_table()
+
+
+def get_multiplier(hits: int, bombs: int = BOMBS_COUNT) -> float:
+    return MULTIPLIERS[bombs][hits]
+
+
+def export_multiplier_table(fp, house_factor: Fraction = HOUSE_FACTOR):
+    """Таблица для аудита в CSV: точный и игровой множитель, шанс дойти и RTP каждой клетки"""
+    # Таблица по переданному house_factor, а не игровая: все столбцы должны сходиться между собой
+    table = MULTIPLIERS if house_factor == HOUSE_FACTOR else build_multiplier_table(house_factor)
+    writer = csv.writer(fp)
+    writer.writerow(["bombs", "hits", "exact_multiplier", "multiplier", "survival", "rtp"])
+    for bombs, row in table.items():
+        for hits in range(1, len(row)):
+            fair = fair_multiplier(bombs, hits)
+            exact = house_factor * fair
+            writer.writerow([bombs, hits, f"{exact.numerator}/{exact.denominator}", f"{row[hits]:.2f}",
+                             f"{float(1 / fair):.10f}", f"{row[hits] / float(fair):.6f}"])
+
+
+def random_bombs(count: int = BOMBS_COUNT) -> int:
+    mask = 0
+    for cell in random.sample(range(FIELD_SIZE), count):
+        mask |= 1 << cell
+    return mask
+
+
+# Кнопки не меняются, поэтому одни и те же объекты переиспользуются во всех клавиатурах
+EMPTY_CHAR = "ㅤ"
+_OPENED_BUTTON = InlineKeyboardButton(text=EMPTY_CHAR, callback_data="ignore")
+_BOMB_BUTTON = InlineKeyboardButton(text="💣", callback_data="ignore")
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _player_buttons(user_id: int):
+    """Закрытые клетки и кнопка «Забрать» игрока: callback_data форматируется один раз"""
+    cells = tuple(InlineKeyboardButton(text="❓", callback_data=f"mine_{i}_{user_id}") for i in range(FIELD_SIZE))
+    cashout = InlineKeyboardButton(text="💸 Забрать выигрыш", callback_data=f"cashout_{user_id}")
+    return cells, cashout
+
+
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _board_markup(user_id: int, clicked: int):
+    cells, cashout = _player_buttons(user_id)
+    keyboard = [
+        [_OPENED_BUTTON if clicked >> i & 1 else cells[i] for i in range(row * 5, row * 5 + 5)]
+        for row in range(5)
+    ]
+    if clicked:
+        keyboard.append([cashout])
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
+@lru_cache(maxsize=KEYBOARD_CACHE_SIZE)
+def _game_over_markup(bombs: int):
+    keyboard = [
+        [_BOMB_BUTTON if bombs >> i & 1 else _OPENED_BUTTON for i in range(row * 5, row * 5 + 5)]
+        for row in range(5)
+    ]
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def get_mines_keyboard(user_id: int, bombs: int, clicked: int, game_over: bool = False):
+    # Готовая разметка по (игрок, открытые клетки) или по расстановке бомб - без пересборки 25 кнопок
+    if game_over:
+        return _game_over_markup(bombs)
+    return _board_markup(user_id, clicked)
+
+
+async def expire_game(bot: Bot, game_key):
+    """Брошенная игра: забираем выигрыш за игрока (без открытых клеток - это возврат ставки)"""
+    game = active_mines.get(game_key)
+    if game is None or not game["active"]:
+        return
+    async with mine_locks.setdefault(game_key, asyncio.Lock()):
+        if not game["active"]:
+            return
+        game["active"] = False
+        hits = game["clicked"].bit_count()
+        win_amount = int(game["bet"] * get_multiplier(hits, game["bombs"]))
+        chat_id, user_id = game_key
+        await database.journal_settle([game["journal"]], [(user_id, win_amount)])
+        if hits:
+            await database.add_daily_win(user_id, win_amount)
+
+        if bot is not None:
+            await board_edits.send_now(
+                bot, chat_id, game["msg_id"],
+                f"⏳ Игра закрыта за бездействием.\n💰 Зачислено: <b>{win_amount:,}</b> cron".replace(',', ' '),
+                reply_markup=get_mines_keyboard(user_id, game["mines"], game["clicked"], game_over=True),
+                parse_mode="HTML"
+            )
+
+
+async def restore_games(rows):
+    """Поднимает доски из журнала после рестарта. Игры без сообщения (рестарт посреди старта)
+    и дубли одной пары чат-игрок возвращают ставку. Возвращает (восстановлено, возвращено cron)"""
+    games = {}
+    for row in rows:
+        data = json.loads(row["data"]) if row["data"] is not None else None
+        if row["ref"] is None:
+            games[row["id"]] = {
+                "bet": row["amount"],
+                "bombs": data["bombs"],
+                "mines": data["mines"],
+                "clicked": 0,
+                "active": True,
+                "msg_id": None,
+                "journal": row["id"],
+                "key": (data["chat"], row["user_id"]),
+            }
+        elif row["ref"] in games:
+            game = games[row["ref"]]
+            if row["event"] == "msg":
+                game["msg_id"] = data
+            elif row["event"] == "click":
+                game["clicked"] |= 1 << data
+
+    stale = set()
+    for journal_id, game in games.items():  # по возрастанию id: поздняя игра пары вытесняет раннюю
+        game_key = game.pop("key")
+        if game["msg_id"] is None:
+            stale.add(journal_id)
+            continue
+        old_game = active_mines.get(game_key)
+        if old_game is not None:
+            stale.add(old_game["journal"])
+        active_mines[game_key] = game
+
+    # Ходы без начала игры тоже чистятся, денег за ними нет
+    refunded = await database.refund_journal([
+        row for row in rows
+        if row["id"] in stale or row["ref"] in stale or (row["ref"] is not None and row["ref"] not in games)
+    ])
+    if games:
+        logging.info(f"Мины: восстановлено {len(games) - len(stale)} игр из журнала, возвращено {refunded} cron")
+    return len(games) - len(stale), refunded
+
+
+mines_sessions = sessions.register("мины", IDLE_TIMEOUT, active_mines, mine_locks, expire_game)
+
+
 @mines_router.message(F.text.lower().startswith("мины"))
 async def cmd_start_mines(message: Message, bot: Bot):
     chat_id = message.chat.id
@@ -63,41 +202,48 @@ async def cmd_start_mines(message: Message, bot: Bot):
         return
 
     args = message.text.split()
-    if len(args) != 2 or not args[1].isdigit():
-        return await message.answer("⚠️ Формат: <code>мины [ставка]</code>", parse_mode="HTML")
+    if len(args) not in (2, 3) or not all(arg.isdigit() for arg in args[1:]):
+        return await message.answer("⚠️ Формат: <code>мины [ставка] [бомбы 1-24]</code>", parse_mode="HTML")
 
     bet = int(args[1])
     if bet <= 0: return
-
-    balance = await database.get_balance(user_id)
-    if balance < bet:
-        return await message.answer("⚠️ Недостаточно cron!")
+    bombs_count = int(args[2]) if len(args) == 3 else BOMBS_COUNT
+    if not MIN_BOMBS <= bombs_count <= MAX_BOMBS:
+        return await message.answer(f"⚠️ Бомб может быть от {MIN_BOMBS} до {MAX_BOMBS}.")
 
     game_key = (chat_id, user_id)
-    lock = mine_locks.setdefault(game_key, asyncio.Lock())
+    lock = mines_sessions.lock(game_key)
 
     async with lock:
+        # Поле генерируется до списания: оно пишется в журнал вместе со ставкой
+        bombs = random_bombs(bombs_count)
+
+        # Списываем новую ставку одним запросом (проверка баланса внутри)
+        entry = database.JournalEntry("mines", "start", {"chat": chat_id, "bombs": bombs_count, "mines": bombs})
+        ok, _ = await database.try_debit(user_id, bet, journal=entry)
+        if not ok:
+            return await message.answer("⚠️ Недостаточно cron!")
+
         # ЛОГИКА УДАЛЕНИЯ СТАРОЙ ИГРЫ
         if game_key in active_mines:
             old_game = active_mines[game_key]
             if old_game["active"]:
+                old_game["active"] = False
                 # Возврат ставки
-                await database.add_balance(user_id, old_game["bet"])
-                # Попытка удалить старое сообщение с кнопками
+                await database.journal_settle([old_game["journal"]], [(user_id, old_game["bet"])])
+                # Попытка удалить старое сообщение с кнопками (его отложенная правка уже не нужна)
+                await board_edits.drop(chat_id, old_game["msg_id"])
                 try:
                     await bot.delete_message(chat_id, old_game["msg_id"])
                 except Exception:
                     pass
 
-        await database.add_balance(user_id, -bet)
-        bombs = random.sample(range(25), BOMBS_COUNT)
-
         formatted_bet = f"{bet:,}".replace(',', ' ')
         mention = message.from_user.mention_html(message.from_user.first_name)
 
-        kb = get_mines_keyboard(user_id, bombs, [])
+        kb = get_mines_keyboard(user_id, bombs, 0)
         new_msg = await message.answer(
-            f"{mention}, вы начали игру минное поле!\n💰 Ставка: {formatted_bet} cron",
+            f"{mention}, вы начали игру минное поле!\n💰 Ставка: {formatted_bet} cron\n💣 Бомб: {bombs_count}",
             reply_markup=kb,
             parse_mode="HTML"
         )
@@ -105,17 +251,23 @@ async def cmd_start_mines(message: Message, bot: Bot):
         # Сохраняем ID сообщения новой игры
         active_mines[game_key] = {
             "bet": bet,
+            "bombs": bombs_count,
             "mines": bombs,
-            "clicked": [],
+            "clicked": 0,
             "active": True,
-            "msg_id": new_msg.message_id
+            "msg_id": new_msg.message_id,
+            "journal": entry.id
         }
+        # Без сообщения игру не продолжить, так что до этой записи рестарт просто вернет ставку
+        await database.journal_append("mines", entry.id, "msg", new_msg.message_id)
 
 
 @mines_router.callback_query(F.data.startswith("mine_"))
 async def process_mine_click(callback: CallbackQuery):
     parts = callback.data.split("_")
     cell_index, owner_id = int(parts[1]), int(parts[2])
+    if not 0 <= cell_index < FIELD_SIZE:
+        return await callback.answer()
 
     if callback.from_user.id != owner_id:
         return await callback.answer("Это не ваша игра!", show_alert=True)
@@ -129,19 +281,24 @@ async def process_mine_click(callback: CallbackQuery):
     if callback.message.message_id != game["msg_id"]:
         return await callback.answer("Эта игра устарела.", show_alert=True)
 
-    lock = mine_locks.setdefault(game_key, asyncio.Lock())
+    lock = mines_sessions.lock(game_key)
     async with lock:
-        if not game["active"] or cell_index in game["clicked"]:
+        cell = 1 << cell_index
+        if not game["active"] or game["clicked"] & cell:
             return await callback.answer()
 
-        game["clicked"].append(cell_index)
+        game["clicked"] |= cell
         mention = callback.from_user.mention_html(callback.from_user.first_name)
+        chat_id, msg_id = game_key[0], game["msg_id"]
 
         # ПРОИГРЫШ
-        if cell_index in game["mines"]:
+        if game["mines"] & cell:
             game["active"] = False
+            await database.journal_settle([game["journal"]], wait=False)
+            await callback.answer()
             kb = get_mines_keyboard(owner_id, game["mines"], game["clicked"], game_over=True)
-            await callback.message.edit_text(
+            await board_edits.send_now(
+                callback.bot, chat_id, msg_id,
                 f"{mention}, игра завершена!\n💵 Вы проиграли",
                 reply_markup=kb,
                 parse_mode="HTML"
@@ -150,33 +307,37 @@ async def process_mine_click(callback: CallbackQuery):
             mine_locks.pop(game_key, None)
             return
 
-        hits = len(game["clicked"])
-        mult = get_multiplier(hits)
+        hits = game["clicked"].bit_count()
+        mult = get_multiplier(hits, game["bombs"])
         current_win = int(game["bet"] * mult)
 
         # ПОБЕДА (открыты все пустые клетки)
-        if hits == (25 - BOMBS_COUNT):
+        if hits == (FIELD_SIZE - game["bombs"]):
             game["active"] = False
-            await database.add_balance(owner_id, current_win)
+            await database.journal_settle([game["journal"]], [(owner_id, current_win)])
+            await callback.answer()
             kb = get_mines_keyboard(owner_id, game["mines"], game["clicked"], game_over=True)
-            await callback.message.edit_text(
+            await board_edits.send_now(
+                callback.bot, chat_id, msg_id,
                 f"{mention}, поле пройдено!\n💰 Выигрыш: {current_win:,} cron".replace(',', ' '),
                 reply_markup=kb,
                 parse_mode="HTML"
             )
             active_mines.pop(game_key, None)
             mine_locks.pop(game_key, None)
-        # ПРОДОЛЖЕНИЕ ИГРЫ
+        # ПРОДОЛЖЕНИЕ ИГРЫ: ответ сразу, доска уйдет одной правкой после серии кликов
         else:
+            await database.journal_append("mines", game["journal"], "click", cell_index)
             kb = get_mines_keyboard(owner_id, game["mines"], game["clicked"])
             formatted_bet = f"{game['bet']:,}".replace(',', ' ')
             formatted_win = f"{current_win:,}".replace(',', ' ')
-            await callback.message.edit_text(
+            board_edits.push(
+                callback.bot, chat_id, msg_id,
                 f"{mention}, вы начали игру минное поле!\n💰 Ставка: {formatted_bet}\n💵 Выигрыш: <b>x{mult}</b> | <b>{formatted_win}</b> cron",
                 reply_markup=kb,
                 parse_mode="HTML"
             )
-        await callback.answer()
+            await callback.answer()
 
 
 @mines_router.callback_query(F.data.startswith("cashout_"))
@@ -190,22 +351,26 @@ async def process_cashout(callback: CallbackQuery):
         return await callback.answer("Игра уже завершена.")
 
     game = active_mines[game_key]
-    lock = mine_locks.setdefault(game_key, asyncio.Lock())
+    lock = mines_sessions.lock(game_key)
 
     async with lock:
+        if not game["active"]:
+            return await callback.answer("Игра уже завершена.")
         game["active"] = False
-        mult = get_multiplier(len(game["clicked"]))
+        mult = get_multiplier(game["clicked"].bit_count(), game["bombs"])
         win_amount = int(game["bet"] * mult)
 
-        # Начисляем баланс
-        await database.add_balance(owner_id, win_amount)
+        # Начисляем баланс и закрываем игру в журнале
+        await database.journal_settle([game["journal"]], [(owner_id, win_amount)])
         await database.add_daily_win(owner_id, win_amount)
 
         mention = callback.from_user.mention_html(callback.from_user.first_name)
         kb = get_mines_keyboard(owner_id, game["mines"], game["clicked"], game_over=True)
+        await callback.answer(f"Зачислено +{win_amount} cron")
 
-        # Исправленный вызов с parse_mode="HTML"
-        await callback.message.edit_text(
+        # Итог ложится поверх отложенной доски, а не наоборот
+        await board_edits.send_now(
+            callback.bot, game_key[0], game["msg_id"],
             f"{mention}, вы забрали выигрыш!\n💰 Сумма: <b>{win_amount:,}</b> cron".replace(',', ' '),
             reply_markup=kb,
             parse_mode="HTML"
@@ -214,7 +379,6 @@ async def process_cashout(callback: CallbackQuery):
         # Очищаем память
         active_mines.pop(game_key, None)
         mine_locks.pop(game_key, None)
-        await callback.answer(f"Зачислено +{win_amount} cron")
 
 @mines_router.callback_query(F.data == "ignore")
 async def process_ignore(callback: CallbackQuery):
@@ -1,3 +1,4 @@
+from datetime import datetime
 from aiogram import Router, F
 from aiogram.types import Message
 from database import make_transfer, get_history, check_user, get_currency_symbol
@@ -75,15 +76,9 @@ async def show_history(message: Message):
 
     for row in history:
         amount = row['amount']
-        # Преобразуем дату из БД (24.02.2026 01:59) в нужный формат (24.02 + 01:59)
-        # Если в базе дата хранится как "24.02.2026 01:59", берем части строки
-        raw_time = row['timestamp']
-        try:
-            date_part = raw_time[:5]     # 24.02
-            time_part = raw_time[-5:]    # 01:59
-            display_time = f"{date_part} + {time_part}"
-        except:
-            display_time = raw_time
+        # Время в БД - секунды epoch, показываем как 24.02 + 01:59
+        ts = row['timestamp']
+        display_time = datetime.fromtimestamp(ts).strftime("%d.%m + %H:%M") if ts else "?"
 
         if row['from_user_id'] == message.from_user.id:
             # Исходящий перевод (-)
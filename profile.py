@@ -1,7 +1,7 @@
-from aiogram import Router, F
+from aiogram import Router, F, html
 from aiogram.types import Message
 from datetime import datetime
-from database import get_user_data, get_currency_symbol, get_tap_emoji
+from database import get_user_data, get_currency_symbol, get_tap_emoji, get_top_rich, get_user_rank
 
 router = Router()
 
@@ -26,8 +26,9 @@ async def show_profile(message: Message):
     name_mention = get_mention(user_id, message.from_user.first_name)
     balance_val = f"{user['balance']:,}".replace(',', ' ')
 
-    # Дата регистрации (если в базе нет, ставим текущую для примера)
-    reg_date = user['reg_date'] if user['reg_date'] else datetime.now().strftime("%d.%m.%Y")
+    # Дата регистрации хранится в секундах epoch (если в базе нет, ставим текущую для примера)
+    reg_dt = datetime.fromtimestamp(user['reg_date']) if user['reg_date'] else datetime.now()
+    reg_date = reg_dt.strftime("%d.%m.%Y")
 
     # 3. Формируем текст профиля согласно дизайну
     text = (
@@ -38,4 +39,32 @@ async def show_profile(message: Message):
         f"<blockquote>💬 <b>дата регистрации: {reg_date}</b></blockquote>"
     )
 
-    await message.answer(text, parse_mode="HTML")
\ No newline at end of file
+    await message.answer(text, parse_mode="HTML")
+
+
+@router.message(F.text.lower() == "топ")
+async def show_top(message: Message):
+    top = await get_top_rich(10)
+    if not top:
+        return await message.answer("Рейтинг пока пуст.")
+
+    cur_symbol = await get_currency_symbol()
+    lines = ["<b>🏆 Топ богачей:</b>\n"]
+    for i, user in enumerate(top, 1):
+        name = html.quote(str(user['full_name'] or user['username'] or user['user_id']))
+        balance_val = f"{user['balance'] or 0:,}".replace(',', ' ')
+        lines.append(f"<b>{i}.</b> {get_mention(user['user_id'], name)} — {balance_val} {cur_symbol}")
+
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+@router.message(F.text.lower().in_({"ранг", "место"}))
+async def show_rank(message: Message):
+    user_id = message.from_user.id
+    rank, total = get_user_rank(user_id)
+    mention = get_mention(user_id, html.quote(message.from_user.first_name))
+
+    if rank is None:
+        return await message.answer(f"{mention}, вас пока нет в рейтинге.", parse_mode="HTML")
+
+    await message.answer(f"{mention}, ваше место в рейтинге: <b>{rank}</b> из {total}", parse_mode="HTML")
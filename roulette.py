@@ -1,21 +1,32 @@
 import re
-import random
 import asyncio
+import logging
 import time
+from datetime import datetime
 from aiogram import Router, F, Bot
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram import html
 
 from database import (
-    get_balance, add_balance, save_last_bet, get_last_bet,
-    add_game_log, get_game_logs, get_currency_icon, add_daily_win, is_games_enabled
+    try_debit, debit_up_to, get_last_bet, get_game_logs, get_currency_icon, is_games_enabled,
+    settle_round, set_filter, get_filter, get_spin, spin_stats, JournalEntry, journal_settle
 )
+from fair_rng import fair_rng, outcome, verify
+from moder import scheduler, is_admin
+from roulette_engine import RED_NUMBERS, BetBook, kind_display, normalize_saved_bets
+from bet_parser import MAX_BETS_PER_MESSAGE, parse_bet_line, scale_bets
+from roulette_render import render_round
+from roulette_stats import STATS_WINDOWS
+from sessions import register
 
 router = Router()
 games = {}
 user_locks = {}
-chat_locks = {}
-RED_NUMBERS = [1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36]
+ROUND_COUNTDOWN = 15  # секунд от первой ставки до запуска
+USER_LOCK_TTL = 10 * 60  # замок игрока без ставок дольше этого выселяется
+
+# Раунды сами чистятся после спина, а замки игроков - только чистильщиком
+user_sessions = register("рулетка", USER_LOCK_TTL, locks=user_locks)
 
 
 def get_styled_mention(user):
@@ -27,6 +38,82 @@ def get_color(n):
     return "🔴" if n in RED_NUMBERS else "⚫"
 
 
+def new_game():
+    # journal: user_id -> id записей журнала со ставками игрока в этом раунде
+    # thread_id: тема форума, где открыт раунд - туда же идут анимация и итоги
+    return {"bets": BetBook(), "start_time": 0, "journal": {}, "thread_id": None}
+
+
+def topic_id(message: Message):
+    # Как в message.answer: тема указывается только для сообщений из темы форума
+    return message.message_thread_id if message.is_topic_message else None
+
+
+def add_bets(game, user_id, mention, bets, entry):
+    game["bets"].add(user_id, mention, bets)
+    game["journal"].setdefault(user_id, []).append(entry.id)
+
+
+def current_game(chat_id):
+    """Открытый раунд чата. Вызывать без await до добавления ставок: закрытый раунд уже убран из games"""
+    game = games.get(chat_id)
+    if game is None:
+        game = games[chat_id] = new_game()
+    return game
+
+
+async def open_round(game, bot: Bot, chat_id, thread_id=None):
+    """Первая ставка раунда запускает отсчет; в режиме автоспина раунд ставится в планировщик"""
+    game["start_time"] = time.time() + ROUND_COUNTDOWN
+    game["thread_id"] = thread_id
+    try:
+        # Цепочка, из которой выпадет исход, записывается в базу до закрытия раунда
+        await fair_rng.ensure(chat_id)
+    except Exception:
+        # Без заранее записанной цепочки draw откажет, и раунд вернет ставки
+        logging.exception(f"Не удалось подготовить цепочку хешей для чата {chat_id}")
+    if await get_filter(chat_id, "auto_spin") == 1:
+        schedule_spin(bot, chat_id, game["start_time"])
+
+
+def schedule_spin(bot: Bot, chat_id, start_time):
+    # Один общий планировщик на все чаты: задача на чат, а не корутина со sleep
+    scheduler.add_job(
+        auto_spin,
+        "date",
+        run_date=datetime.fromtimestamp(start_time),
+        args=[bot, chat_id],
+        id=f"roulette_spin:{chat_id}",
+        replace_existing=True,
+        misfire_grace_time=None
+    )
+
+
+async def auto_spin(bot: Bot, chat_id):
+    game = games.get(chat_id)
+    if not game or not game["bets"]:
+        # Все ставки отменили - чат больше не держим в памяти
+        games.pop(chat_id, None)
+        return
+    if time.time() < game["start_time"]:
+        # Сработали раньше отсчета (часы, перенос start_time) - ждем остаток, а не теряем раунд
+        schedule_spin(bot, chat_id, game["start_time"])
+        return
+    await run_round(bot, chat_id)
+
+
+@router.message(F.text.lower().in_(["+автоспин", "-автоспин"]), F.chat.type != "private")
+async def toggle_auto_spin(message: Message):
+    if not await is_admin(message):
+        return
+    value = 1 if message.text.lower() == "+автоспин" else 0
+    await set_filter(message.chat.id, "auto_spin", value)
+    await message.answer(
+        f"✅ Рулетка будет запускаться сама через {ROUND_COUNTDOWN} сек. после первой ставки." if value
+        else "⏹ Автоспин выключен, рулетку запускает команда «го»."
+    )
+
+
 @router.message(
     F.chat.type != "private",
     F.text.regexp(re.compile(r"^(лог|ставки|отмена|отменить|\d+)", re.IGNORECASE))
@@ -51,113 +138,68 @@ async def handle_bets(message: Message):
         res = "\n".join([f"<b>{n}</b> {c}" for n, c in logs[:10]])
         return await message.answer(f"<b>Последние игры:</b>\n{res}", parse_mode="HTML")
 
-    game = games.setdefault(chat_id, {"bets": {}, "start_time": 0, "is_running": False})
-
-    if game["is_running"]:
-        if command.isdigit() or command in {"отмена", "отменить"}:
-            return await message.reply("⏳ Дождитесь результата рулетки")
-        return
+    # Новый раунд попадает в games только вместе с первой ставкой
+    game = games.get(chat_id) or new_game()
 
     if command == "ставки":
-        if user_id not in game["bets"]:
+        book = game["bets"]
+        if user_id not in book:
             return await message.answer("У вас нет активных ставок.")
-        user_data = game["bets"][user_id]
-        lines = [f"{user_data['mention']} {b['amount']} на {b['display']}" for b in user_data["items"]]
+        mention = book.mention(user_id)
+        lines = [f"{mention} {amount} на {kind_display(kind)}" for kind, amount in book.user_bets(user_id)]
         for i in range(0, len(lines), 30):
             chunk = "\n".join(lines[i:i + 30])
             await message.answer(chunk, parse_mode="HTML")
         return
 
-    lock = user_locks.setdefault(user_id, asyncio.Lock())
+    lock = user_sessions.lock(user_id)
 
     async with lock:
         if command in {"отмена", "отменить"}:
-            if user_id in game["bets"]:
-                total_return = sum(bet['amount'] for bet in game["bets"][user_id]["items"])
-                mention = game["bets"][user_id]["mention"]
+            # Отменить можно только ставки открытого раунда: закрытый уже рассчитывается
+            game = games.get(chat_id) or new_game()
+            book = game["bets"]
+            if user_id in book:
+                mention = book.mention(user_id)
+                total_return = book.remove_user(user_id)
                 icon = get_currency_icon()
-                await add_balance(user_id, total_return)
-                del game["bets"][user_id]
-                if not game["bets"]:
-                    game["start_time"] = 0
+                # Возврат и закрытие ставок в журнале - одной транзакцией
+                await journal_settle(game["journal"].pop(user_id, []), [(user_id, total_return)])
+                if not book:
+                    games.pop(chat_id, None)
                 return await message.answer(f"{mention}, ставки отменены. Возвращено: {total_return} {icon}",
                                             parse_mode="HTML")
             return await message.answer("У вас нет активных ставок.")
 
-        # --- ПРИЕМ СТАВОК С УЛУЧШЕННОЙ ПРОВЕРКОЙ ---
+        # --- ПРИЕМ СТАВОК ---
         if command.isdigit():
-            amount = int(command)
-            if amount <= 0:
-                return
-
-            args = text_parts[1:]
-            if not args:
-                return
-
-            # Ограничиваем количество, но проверяем строгость
-            if len(args) > 100:
-                await message.reply("Максимум 100 ставок за сообщение.")
-                args = args[:100]
-
-            temp_new_bets = []
-            red_aliases = {'к', 'красное', 'red'}
-            black_aliases = {'ч', 'черное', 'black'}
-            zero_aliases = {'з', 'зеленое', 'zero', '0'}
-
-            for arg in args:
-                # 1. Проверка на цвета
-                if arg in red_aliases:
-                    temp_new_bets.append({"type": "red", "amount": amount, "display": "RED"})
-                elif arg in black_aliases:
-                    temp_new_bets.append({"type": "black", "amount": amount, "display": "BLACK"})
-                elif arg in zero_aliases:
-                    temp_new_bets.append({"type": "number", "amount": amount, "value": 0, "display": "ZERO"})
-
-                # 2. Проверка на диапазоны (строго число-число)
-                elif '-' in arg:
-                    try:
-                        parts = arg.split('-')
-                        if len(parts) == 2 and parts[0].isdigit() and parts[1].isdigit():
-                            s_raw, e_raw = int(parts[0]), int(parts[1])
-                            s, e = sorted([s_raw, e_raw])
-                            if 0 <= s <= 36 and 0 <= e <= 36:
-                                temp_new_bets.append(
-                                    {"type": "range", "amount": amount, "value": (s, e), "display": f"{s}-{e}"})
-                    except ValueError:
-                        continue
-
-                # 3. Проверка на конкретные числа (строго цифры)
-                elif arg.isdigit():
-                    n = int(arg)
-                    if 1 <= n <= 36:
-                        temp_new_bets.append({"type": "number", "amount": amount, "value": n, "display": str(n)})
-
-                # Если аргумент не подошел ни под одно правило (например "привет"), он просто игнорируется
-
-            if not temp_new_bets:
-                return  # Ставка не делается, если ни один аргумент не прошел проверку
-
-            user_balance = await get_balance(user_id)
-            icon = get_currency_icon()
-            total_cost = len(temp_new_bets) * amount
+            parsed = parse_bet_line(message.text)
+            if parsed is None:
+                return  # Ставка не делается, если в строке нет ни одной ставки
+            temp_new_bets, truncated = parsed
+            amount = temp_new_bets[0][1]
+
+            if truncated:
+                await message.reply(f"Максимум {MAX_BETS_PER_MESSAGE} ставок за сообщение.")
 
-            if user_balance < total_cost:
-                can_afford = user_balance // amount
-                if can_afford <= 0:
-                    return await message.reply(f"Недостаточно {icon}!")
-                temp_new_bets = temp_new_bets[:can_afford]
-                total_cost = len(temp_new_bets) * amount
+            icon = get_currency_icon()
 
-            await add_balance(user_id, -total_cost)
+            # Списываем сразу столько ставок, на сколько хватает баланса (одним запросом)
+            entry = JournalEntry("roulette", "bet", {"chat": chat_id})
+            can_afford, _ = await debit_up_to(user_id, amount, len(temp_new_bets), journal=entry)
+            if can_afford <= 0:
+                return await message.reply(f"Недостаточно {icon}!")
+            temp_new_bets = temp_new_bets[:can_afford]
 
             mention = get_styled_mention(message.from_user)
-            user_game_data = game["bets"].setdefault(user_id, {"items": [], "mention": mention})
-            user_game_data["items"].extend(temp_new_bets)
+            # Пока шло списание, прошлый раунд мог закрыться - ставка уходит в открытый
+            game = current_game(chat_id)
+            add_bets(game, user_id, mention, temp_new_bets, entry)
 
             if game["start_time"] == 0:
-                game["start_time"] = time.time() + 15
+                await open_round(game, message.bot, chat_id, topic_id(message))
 
-            confirm_lines = [f"Ставка принята: {mention} {amount} {icon} на {b['display']}" for b in temp_new_bets]
+            confirm_lines = [f"Ставка принята: {mention} {amount} {icon} на {kind_display(kind)}" for kind, _ in temp_new_bets]
 
             for i in range(0, len(confirm_lines), 20):
                 chunk = "\n".join(confirm_lines[i:i + 20])
@@ -217,10 +259,6 @@ async def start_roulette(message: Message, bot: Bot):
         return
     game = games[chat_id]
 
-    chat_lock = chat_locks.setdefault(chat_id, asyncio.Lock())
-    if chat_lock.locked():
-        return
-
     if message.from_user.id not in game["bets"]:
         return await message.reply("❌ Вы не можете запустить рулетку, так как не сделали ставку!")
 
@@ -228,115 +266,187 @@ async def start_roulette(message: Message, bot: Bot):
     if remaining > 0:
         return await message.answer(f"⏳ Осталось еще {int(remaining)} сек.")
 
-    async with chat_lock:
-        game["is_running"] = True
+    await run_round(bot, chat_id)
 
-        win_num = random.randint(0, 36)
-        win_color = get_color(win_num)
-        ball_emoji = "🟢" if win_num == 0 else ("🔴" if win_color == "🔴" else "⚫")
-
-        await add_game_log(chat_id, win_num, win_color)
-
-        all_lines = []
-        winners_summary = []
-
-        # --- РАСЧЕТ ВЫИГРЫШЕЙ ---
-        for u_id, user_data in game["bets"].items():
-            mention = user_data["mention"]
-            total_win = 0
-
-            await save_last_bet(u_id, user_data["items"])
-
-            for b in user_data["items"]:
-                amount_val = b['amount']
-                # УБРАЛИ {icon} ИЗ ЭТОЙ СТРОКИ
-                all_lines.append(f"{mention} {amount_val} на {b['display']}")
-
-                win, mult = False, 0
-
-                # Логика выигрыша (компактная запись)
-                if b["type"] == "red" and win_color == "🔴":
-                    win, mult = True, 2
-                elif b["type"] == "black" and win_color == "⚫":
-                    win, mult = True, 2
-                elif b["type"] == "number" and b["value"] == win_num:
-                    win, mult = True, 36
-                elif b["type"] == "range":
-                    start, end = b["value"]
-                    if start <= win_num <= end:
-                        diff = end - start + 1
-                        win, mult = True, (36 / diff) * 0.98
-
-                if win:
-                    win_amt = int(amount_val * mult)
-                    total_win += win_amt
-                    # УБРАЛИ {icon} ИЗ ЭТОЙ СТРОКИ
-                    winners_summary.append(f"{mention} выиграл {win_amt} на {b['display']}")
-
-            if total_win > 0:
-                await add_balance(u_id, total_win)
-                await add_daily_win(u_id, total_win)
-
-        # --- АНИМАЦИЯ (СТИКЕРЫ) ---
-        s_id = STICKER_MAP.get(win_num)
-        if s_id:
-            try:
-                sticker_msg = await message.answer_sticker(s_id)
-                await asyncio.sleep(4.5)
-                try:
-                    await bot.delete_message(chat_id, sticker_msg.message_id)
-                except Exception:  # Безопасный перехват
-                    pass
-            except Exception:  # Безопасный перехват
-                await asyncio.sleep(2)
 
-        # --- ЗАВЕРШЕНИЕ И ОЧИСТКА ---
-        games.pop(chat_id, None)
-        chat_locks.pop(chat_id, None)  # Очищаем замок, чтобы не было утечки памяти
-
-        kb = InlineKeyboardMarkup(inline_keyboard=[[
-            InlineKeyboardButton(text="Повторить", callback_data="rebet"),
-            InlineKeyboardButton(text="Удвоить", callback_data="double")
-        ]])
-
-        # Формируем текст с умным разделением на блоки (лимит 4096 символов)
-        messages_to_send = []
-        current_text = f"<b>Результаты рулетки: {win_num} {ball_emoji}</b>\n\n<b>Ставки:</b>\n"
-
-        # Заполняем ставки
-        for line in all_lines:
-            if len(current_text) + len(line) > 3800:
-                messages_to_send.append(current_text)
-                current_text = "<b>Ставки (продолжение):</b>\n" + line + "\n"
-            else:
-                current_text += line + "\n"
-
-        current_text += "\n<b>Победители:</b>\n"
-
-        # Заполняем победителей
-        if not winners_summary:
-            current_text += "Никто не выиграл\n"
-        else:
-            for line in winners_summary:
-                if len(current_text) + len(line) > 3800:
-                    messages_to_send.append(current_text)
-                    current_text = "<b>Победители (продолжение):</b>\n" + line + "\n"
-                else:
-                    current_text += line + "\n"
+async def run_round(bot: Bot, chat_id):
+    """Крутит рулетку чата: по команде «го» или по таймеру автоспина.
 
-        # Добавляем финальный кусок текста в список отправки
-        messages_to_send.append(current_text)
+    Книга ставок закрывается без единого await, поэтому замок не нужен: повторный «го»
+    или автоспин ее уже не найдут. Дальше раунд живет сам по себе:
+    расчет идет параллельно с анимацией, а новые ставки уже копятся в следующем раунде.
+    """
+    # --- 1. ЗАКРЫТИЕ КНИГИ ---
+    game = games.get(chat_id)
+    if not game or not game["bets"]:
+        return
+    games.pop(chat_id, None)
+
+    book = game["bets"]
+    thread_id = game["thread_id"]
+    journal_ids = [journal_id for ids in game["journal"].values() for journal_id in ids]
+    try:
+        # Исход - очередной хеш заранее опубликованной цепочки чата (проверяется командой «проверка»)
+        win_num, proof, chain_id = await fair_rng.draw(chat_id)
+        win_color = get_color(win_num)
 
-        # Отправляем все собранные сообщения
-        for i, text_block in enumerate(messages_to_send):
-            # Клавиатуру с кнопками цепляем только к самому последнему сообщению
-            markup = kb if i == len(messages_to_send) - 1 else None
+        # --- 2. РАСЧЕТ ПАРАЛЛЕЛЬНО С АНИМАЦИЕЙ ---
+        settlement = asyncio.create_task(settle_book(chat_id, book, win_num, win_color, (chain_id, proof), journal_ids))
+        await play_animation(bot, chat_id, win_num, thread_id)  # ошибки Telegram гасит сама
+        spin_id, wins, totals = await settlement
+    except Exception:
+        # Итоги не записаны (settle_round - одна транзакция), значит книга целиком у нас: возвращаем ставки
+        logging.exception(f"Раунд рулетки в чате {chat_id} не рассчитан")
+        await refund_round(bot, chat_id, book, journal_ids, thread_id)
+        return
 
-            await message.answer(text_block, parse_mode="HTML", reply_markup=markup)
+    # --- 3. ПУБЛИКАЦИЯ ---
+    await publish_results(bot, chat_id, spin_id, win_num, win_color, book, wins, totals, thread_id)
+
+
+async def refund_round(bot: Bot, chat_id, book, journal_ids, thread_id=None):
+    refunds = [(u_id, sum(amount for _, amount in book.user_bets(u_id))) for _, u_id, _ in book.players()]
+    try:
+        await journal_settle(journal_ids, refunds)
+    except Exception:
+        # Ставки остались в журнале - их вернет восстановление при следующем старте
+        logging.exception(f"Не удалось вернуть ставки раунда в чате {chat_id}")
+        text = "⚠️ Раунд не удалось рассчитать. Ставки будут возвращены после перезапуска бота."
+    else:
+        text = "⚠️ Раунд не удалось рассчитать, все ставки возвращены."
+    try:
+        await bot.send_message(chat_id, text, message_thread_id=thread_id)
+    except Exception:
+        pass
+
+
+async def settle_book(chat_id, book, win_num, win_color, proof, journal_ids=()):
+    """Рассчитывает закрытую книгу и записывает итоги. Возвращает (номер спина, выигрыши по ставкам, итоги по игрокам)"""
+    # Книга закрыта и больше не меняется, так что большой раунд можно считать в потоке
+    wins, totals = await asyncio.to_thread(book.settle, win_num)
+
+    payouts = []
+    last_bets = []
+    for owner, u_id, _ in book.players():
+        last_bets.append((u_id, book.user_bets(u_id)))
+        if totals[owner] > 0:
+            payouts.append((u_id, totals[owner]))
+
+    # Лог, выигрыши, снимки ставок и закрытие журнала - одной транзакцией; результаты публикуются после commit
+    spin_id = await settle_round(chat_id, (win_num, win_color), payouts, last_bets, proof=proof, journal_ids=journal_ids)
+    return spin_id, wins, totals
+
+
+async def play_animation(bot: Bot, chat_id, win_num, thread_id=None):
+    s_id = STICKER_MAP.get(win_num)
+    if s_id:
+        try:
+            sticker_msg = await bot.send_sticker(chat_id, s_id, message_thread_id=thread_id)
+            await asyncio.sleep(4.5)
+            try:
+                await bot.delete_message(chat_id, sticker_msg.message_id)
+            except Exception:  # Безопасный перехват
+                pass
+        except Exception:  # Безопасный перехват
+            await asyncio.sleep(2)
+
+
+async def publish_results(bot: Bot, chat_id, spin_id, win_num, win_color, book, wins, totals, thread_id=None):
+    ball_emoji = "🟢" if win_num == 0 else ("🔴" if win_color == "🔴" else "⚫")
+
+    kb = InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="Повторить", callback_data="rebet"),
+        InlineKeyboardButton(text="Удвоить", callback_data="double")
+    ]])
+
+    # Большие раунды сворачиваются в итоги по игрокам, длина режется по UTF-16 (лимит Telegram)
+    messages_to_send = render_round(spin_id, win_num, ball_emoji, book, wins, totals)
+
+    # Отправляем все собранные сообщения
+    for i, text_block in enumerate(messages_to_send):
+        # Клавиатуру с кнопками цепляем только к самому последнему сообщению
+        markup = kb if i == len(messages_to_send) - 1 else None
+
+        await bot.send_message(chat_id, text_block, parse_mode="HTML", reply_markup=markup,
+                               message_thread_id=thread_id)
+
+        # Если это не последнее сообщение, делаем микро-паузу
+        if i < len(messages_to_send) - 1:
+            await asyncio.sleep(0.3)
+
+def _spins_word(n):
+    if n % 10 == 1 and n % 100 != 11:
+        return "спин"
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return "спина"
+    return "спинов"
+
+
+@router.message(F.text.lower() == "стата", F.chat.type != "private")
+async def roulette_stats(message: Message):
+    # Все счетчики в памяти, обновляются на каждом спине - к базе не ходим
+    stats = spin_stats.get(message.chat.id)
+    if stats is None or not stats.spins:
+        return await message.answer("История игр пуста")
+
+    lines = [f"📊 <b>Статистика рулетки</b> (всего {stats.spins} {_spins_word(stats.spins)})"]
+    shown = 0
+    for window in STATS_WINDOWS:
+        size, hot, cold = stats.hot_cold(window)
+        if size <= shown:
+            break  # спинов меньше, чем в прошлом окне - повторять то же самое незачем
+        shown = size
+        _, counts = stats.window(window)
+        red = sum(counts[n] for n in RED_NUMBERS)
+        zero = counts[0]
+        black = size - red - zero
+        lines.append(f"\n<b>Последние {size}:</b>")
+        lines.append("🔥 Горячие: " + ", ".join(f"{n} ({c})" for n, c in hot))
+        lines.append("🧊 Холодные: " + ", ".join(f"{n} ({c})" for n, c in cold))
+        lines.append(f"🔴 {red * 100 // size}% · ⚫ {black * 100 // size}% · 🟢 {zero * 100 // size}%")
+
+    best_color, best_length = stats.best_run
+    lines.append(f"\nСерия сейчас: {stats.run_color} ×{stats.run_length} (рекорд: {best_color} ×{best_length})")
+    sleepers = ", ".join(f"{n} — {ago} {_spins_word(ago)}" if ago is not None else f"{n} — не выпадало"
+                         for n, ago in stats.sleepers())
+    lines.append(f"💤 Давно не было: {sleepers}")
+    await message.answer("\n".join(lines), parse_mode="HTML")
+
+
+@router.message(F.text.lower() == "честность", F.chat.type != "private")
+async def fair_commitment(message: Message):
+    chain_id, anchor, used, length = await fair_rng.commitment(message.chat.id)
+    await message.answer(
+        f"🔐 <b>Цепочка #{chain_id}</b> (использовано {used} из {length})\n"
+        f"Якорь: <code>{anchor}</code>\n\n"
+        f"Каждый спин раскрывает хеш, sha256 от которого дает предыдущий хеш цепочки, "
+        f"а последний - этот якорь. Проверить спин: <code>проверка номер</code>",
+        parse_mode="HTML"
+    )
+
+
+@router.message(F.text.regexp(re.compile(r"^проверка\s+#?(\d+)$", re.IGNORECASE)), F.chat.type != "private")
+async def fair_verify(message: Message):
+    spin_id = int(message.text.split()[1].lstrip("#"))
+    spin = await get_spin(message.chat.id, spin_id)
+    if not spin:
+        return await message.answer("Спин не найден в истории этого чата.")
+    if not spin["proof"] or not spin["anchor"]:
+        return await message.answer(f"Спин #{spin_id} был до перехода на проверяемый RNG.")
+
+    # Сотня-другая sha256 - это микросекунды, в поток не выносим
+    step = verify(spin["proof"], spin["anchor"], spin["length"])
+    number_ok = outcome(bytes.fromhex(spin["proof"])) == spin["win_number"]
+    verdict = "✅ Спин честный" if step and number_ok else "❌ Проверка не пройдена"
+    await message.answer(
+        f"{verdict}\n"
+        f"Спин #{spin_id}: <b>{spin['win_number']}</b> {spin['win_color']}\n"
+        f"Хеш: <code>{spin['proof']}</code>\n"
+        f"Цепочка #{spin['chain_id']}, якорь: <code>{spin['anchor']}</code>\n"
+        + (f"До якоря {step} шаг(ов) sha256, число из хеша совпадает." if step and number_ok else ""),
+        parse_mode="HTML"
+    )
 
-            # Если это не последнее сообщение, делаем микро-паузу
-            if i < len(messages_to_send) - 1:
-                await asyncio.sleep(0.3)
 
 @router.callback_query(F.data.in_(["rebet", "double"]))
 async def fast_rebet_handler(callback: CallbackQuery):
@@ -346,58 +456,41 @@ async def fast_rebet_handler(callback: CallbackQuery):
     if not await is_games_enabled(chat_id):
         return await callback.answer("Игры в этом чате отключены!", show_alert=True)
 
-    # 2. Сначала проверяем, не крутится ли рулетка, чтобы не дергать базу зря
-    game = games.setdefault(chat_id, {"bets": {}, "start_time": 0, "is_running": False})
-    if game["is_running"]:
-        return await callback.answer("Рулетка уже крутится!", show_alert=True)
-
     user_id = callback.from_user.id
 
-    # 3. Блокировка от случайных двойных нажатий (защита баланса от спама кнопкой)
-    lock = user_locks.setdefault(user_id, asyncio.Lock())
+    # 2. Блокировка от случайных двойных нажатий (защита баланса от спама кнопкой)
+    lock = user_sessions.lock(user_id)
 
     async with lock:
-        # Внутри замка на всякий случай проверяем игру еще раз (вдруг она запустилась пока мы ждали очередь)
-        if game["is_running"]:
-            return await callback.answer("Рулетка уже крутится!", show_alert=True)
-
-        # Теперь можно безопасно обращаться к БД
-        last_bets = await get_last_bet(user_id)
+        last_bets = normalize_saved_bets(await get_last_bet(user_id))
         if not last_bets:
             return await callback.answer("Нет прошлых ставок!", show_alert=True)
 
         multiplier = 2 if callback.data == "double" else 1
-        total_cost = sum(b['amount'] for b in last_bets) * multiplier
+        new_bets = scale_bets(last_bets, multiplier)
+        total_cost = sum(amount for _, amount in new_bets)
 
-        if await get_balance(user_id) < total_cost:
+        # Проверка и списание баланса одним запросом
+        entry = JournalEntry("roulette", "bet", {"chat": chat_id})
+        ok, _ = await try_debit(user_id, total_cost, journal=entry)
+        if not ok:
             return await callback.answer("Недостаточно средств!", show_alert=True)
 
-        # Списываем баланс
-        await add_balance(user_id, -total_cost)
-
         mention = get_styled_mention(callback.from_user)
-        u_data = game["bets"].setdefault(user_id, {"mention": mention, "items": []})
+        # Если рулетка крутится, ставки сразу попадают в следующий раунд
+        game = current_game(chat_id)
+        add_bets(game, user_id, mention, new_bets, entry)
 
         if game["start_time"] == 0:
-            game["start_time"] = time.time() + 15
-
-        lines = []
+            await open_round(game, callback.bot, chat_id, topic_id(callback.message))
 
-        for b in last_bets:
-            new_amt = b['amount'] * multiplier
-            u_data["items"].append({
-                "type": b["type"],
-                "amount": new_amt,
-                "display": b["display"],
-                "value": b.get("value")
-            })
-            # УБРАЛИ {icon} ИЗ ЭТОЙ СТРОКИ
-            lines.append(f"<b>{b['display']}</b> — {new_amt}")
+        # УБРАЛИ {icon} ИЗ ЭТОЙ СТРОКИ
+        lines = [f"<b>{kind_display(kind)}</b> — {amount}" for kind, amount in new_bets]
 
         title = f"{mention} повторил ставки:" if multiplier == 1 else f"{mention} удвоил ставки:"
         await callback.answer("Ставки приняты!")
 
-        # 4. Безопасная отправка (защита от лимита в 4096 символов)
+        # 3. Безопасная отправка (защита от лимита в 4096 символов)
         full_text = f"{title}\n" + "\n".join(lines)
 
         if len(full_text) > 4000:
@@ -0,0 +1,196 @@
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # numpy не обязателен: без него считаем по той же таблице обычным циклом
+    np = None
+
+RED_NUMBERS = frozenset({1, 3, 5, 7, 9, 12, 14, 16, 18, 19, 21, 23, 25, 27, 30, 32, 34, 36})
+RANGE_HOUSE_FACTOR = 0.98
+
+# Коды видов ставок: 0 - красное, 1 - черное, 2..38 - числа 0..36, дальше все диапазоны s-e (s <= e)
+KIND_RED = 0
+KIND_BLACK = 1
+NUMBER_BASE = 2
+
+# С таким количеством ставок numpy уже окупает создание массивов
+NUMPY_MIN_BETS = 64
+# Пока суммы меньше 2**53, float64 в numpy считает так же точно, как int() над float в Python
+_FLOAT_EXACT_LIMIT = 2 ** 53
+
+
+def _build_payouts():
+    """Таблица множителей: строка на вид ставки, столбец на выпавшее число (0 - проигрыш).
+    Заодно строит подписи видов ставок для вывода"""
+    rows = [
+        tuple(2 if n in RED_NUMBERS else 0 for n in range(37)),
+        tuple(2 if n and n not in RED_NUMBERS else 0 for n in range(37)),
+    ]
+    rows += [tuple(36 if n == value else 0 for n in range(37)) for value in range(37)]
+    displays = ["RED", "BLACK", "ZERO"] + [str(n) for n in range(1, 37)]
+
+    range_kinds = {}
+    for start in range(37):
+        for end in range(start, 37):
+            mult = (36 / (end - start + 1)) * RANGE_HOUSE_FACTOR
+            range_kinds[(start, end)] = len(rows)
+            rows.append(tuple(mult if start <= n <= end else 0 for n in range(37)))
+            displays.append(f"{start}-{end}")
+    return rows, tuple(displays), range_kinds
+
+
+PAYOUTS, DISPLAYS, _RANGE_KINDS = _build_payouts()
+# По столбцам: при расчете раунда выпавшее число одно, и нужен только его столбец
+_COLUMNS = tuple(tuple(row[n] for row in PAYOUTS) for n in range(37))
+_PAYOUTS_NP = np.array(PAYOUTS, dtype=np.float64) if np is not None else None
+
+
+def bet_kind(bet_type, value=None):
+    """Код вида ставки по полям type/value (value диапазона из JSON приходит списком)"""
+    if bet_type == "red":
+        return KIND_RED
+    if bet_type == "black":
+        return KIND_BLACK
+    if bet_type == "number":
+        return number_kind(value)
+    if bet_type == "range":
+        start, end = value
+        return range_kind(start, end)
+    raise ValueError(f"Неизвестный тип ставки: {bet_type}")
+
+
+def number_kind(n):
+    return NUMBER_BASE + n
+
+
+def range_kind(start, end):
+    return _RANGE_KINDS[(start, end)]
+
+
+def kind_display(kind):
+    return DISPLAYS[kind]
+
+
+def payout(kind, win_num):
+    return PAYOUTS[kind][win_num]
+
+
+def normalize_saved_bets(bets):
+    """Прошлые ставки из базы -> [(kind, amount)]. Старый формат (словари type/value) тоже понимаем"""
+    result = []
+    for b in bets or ():
+        if isinstance(b, dict):
+            result.append((bet_kind(b["type"], b.get("value")), b["amount"]))
+        else:
+            kind, amount = b
+            result.append((kind, amount))
+    return result
+
+
+def settle(win_num, owners, kinds, amounts, users_count):
+    """Рассчитывает весь раунд за один проход по колонкам ставок.
+
+    owners - номер игрока (0..users_count-1) для каждой ставки, kinds - код вида, amounts - сумма.
+    Возвращает (выигрыши по ставкам, итоги по игрокам).
+    """
+    if np is not None and len(amounts) >= NUMPY_MIN_BETS and sum(amounts) * 36 < _FLOAT_EXACT_LIMIT:
+        return _settle_numpy(win_num, owners, kinds, amounts, users_count)
+
+    column = _COLUMNS[win_num]
+    wins = [0] * len(amounts)
+    totals = [0] * users_count
+    for i, (owner, kind, amount) in enumerate(zip(owners, kinds, amounts)):
+        mult = column[kind]
+        if mult:
+            win = int(amount * mult)
+            wins[i] = win
+            totals[owner] += win
+    return wins, totals
+
+
+def _settle_numpy(win_num, owners, kinds, amounts, users_count):
+    mult = _PAYOUTS_NP[np.asarray(kinds, dtype=np.intp), win_num]
+    wins = (np.asarray(amounts, dtype=np.float64) * mult).astype(np.int64)
+    totals = np.bincount(np.asarray(owners, dtype=np.intp), weights=wins, minlength=users_count)
+    return wins.tolist(), totals.astype(np.int64).tolist()
+
+
+class BetBook:
+    """Ставки одного раунда.
+
+    Вместо словаря на каждую ставку - параллельные массивы (игрок, вид, сумма).
+    Значение ставки (число, диапазон) зашито в код вида, подпись берется из DISPLAYS
+    только при выводе. Упоминание игрока хранится один раз на игрока.
+    """
+
+    __slots__ = ("user_ids", "mentions", "owners", "kinds", "amounts", "_index", "_positions", "_count")
+
+    def __init__(self):
+        self.user_ids = []  # номер игрока -> user_id
+        self.mentions = []  # номер игрока -> HTML-упоминание (None - игрок отменил ставки)
+        self.owners = array("I")
+        self.kinds = array("H")
+        self.amounts = array("q")
+        self._index = {}  # user_id -> номер игрока
+        self._positions = []  # номер игрока -> позиции его ставок в массивах
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, user_id):
+        return user_id in self._index
+
+    def add(self, user_id, mention, bets):
+        """bets - пары (kind, amount)"""
+        owner = self._index.get(user_id)
+        if owner is None:
+            owner = len(self.user_ids)
+            self._index[user_id] = owner
+            self.user_ids.append(user_id)
+            self.mentions.append(mention)
+            self._positions.append(array("I"))
+        positions = self._positions[owner]
+        for kind, amount in bets:
+            positions.append(len(self.amounts))
+            self.owners.append(owner)
+            self.kinds.append(kind)
+            self.amounts.append(amount)
+            self._count += 1
+
+    def mention(self, user_id):
+        return self.mentions[self._index[user_id]]
+
+    def user_bets(self, user_id):
+        """[(kind, amount)] ставок игрока в порядке приема"""
+        owner = self._index.get(user_id)
+        if owner is None:
+            return []
+        kinds, amounts = self.kinds, self.amounts
+        return [(kinds[i], amounts[i]) for i in self._positions[owner]]
+
+    def remove_user(self, user_id):
+        """Снимает все ставки игрока, возвращает их сумму"""
+        owner = self._index.pop(user_id, None)
+        if owner is None:
+            return 0
+        total = 0
+        for i in self._positions[owner]:
+            total += self.amounts[i]
+            self.amounts[i] = 0
+        self._count -= len(self._positions[owner])
+        self._positions[owner] = array("I")
+        self.mentions[owner] = None
+        return total
+
+    def players(self):
+        """(номер, user_id, упоминание) игроков со ставками в порядке первой ставки"""
+        return [(owner, self.user_ids[owner], self.mentions[owner])
+                for owner in range(len(self.user_ids)) if self.mentions[owner] is not None]
+
+    def positions(self, owner):
+        return self._positions[owner]
+
+    def settle(self, win_num):
+        """(выигрыши по позициям, итоги по номерам игроков)"""
+        return settle(win_num, self.owners, self.kinds, self.amounts, len(self.user_ids))
@@ -0,0 +1,136 @@
+from roulette_engine import kind_display
+
+# Telegram ограничивает сообщение 4096 символами UTF-16; берем с запасом, как и раньше
+MESSAGE_LIMIT = 3800
+# До стольких ставок в раунде выводим каждую ставку, дальше - итоги по игрокам
+ITEMIZED_MAX_BETS = 20
+# Сколько строк детализации по видам ставок попадает в итоги раунда
+DETAIL_LINES_LIMIT = 30
+
+# Шаблоны строк собираются один раз
+_HEADER = "<b>Результаты рулетки: {} {}</b>\n<i>Спин #{} · проверка: <code>проверка {}</code></i>\n".format
+_BET_LINE = "{} {} на {}".format
+_WIN_LINE = "{} выиграл {} на {}".format
+_PLAYER_LINE = "{}: {} {}, {} → выигрыш {}".format
+_PLAYER_LOSS_LINE = "{}: {} {}, {} → проигрыш".format
+_DETAIL_LINE = "    {} ×{}: {} → {}".format
+
+
+def utf16_len(text):
+    """Длина так, как ее считает Telegram: символы вне BMP (эмодзи) занимают две единицы"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def fmt_amount(n):
+    return f"{n:,}".replace(",", " ")
+
+
+def bets_word(n):
+    if n % 10 == 1 and n % 100 != 11:
+        return "ставка"
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return "ставки"
+    return "ставок"
+
+
+class MessageBuilder:
+    """Собирает строки в сообщения не длиннее limit единиц UTF-16 (части копятся в списке, без +=)"""
+
+    def __init__(self, limit: int = MESSAGE_LIMIT):
+        self.limit = limit
+        self.messages = []
+        self._parts = []
+        self._size = 0
+
+    def line(self, text, continuation=None):
+        """Добавляет строку; если не влезает - начинает новое сообщение с заголовком continuation"""
+        size = utf16_len(text) + 1
+        if self._parts and self._size + size > self.limit:
+            self.flush()
+            if continuation:
+                self.line(continuation)
+        self._parts.append(text)
+        self._size += size
+
+    def flush(self):
+        if self._parts:
+            self.messages.append("\n".join(self._parts))
+            self._parts = []
+            self._size = 0
+
+    def build(self):
+        self.flush()
+        return self.messages
+
+
+def render_round(spin_id, win_num, ball_emoji, book, wins, totals):
+    """Тексты сообщений с итогами раунда. Маленький раунд - по ставкам, большой - по игрокам"""
+    builder = MessageBuilder()
+    builder.line(_HEADER(win_num, ball_emoji, spin_id, spin_id))
+    if len(book) <= ITEMIZED_MAX_BETS:
+        _render_itemized(builder, book, wins)
+    else:
+        _render_rollup(builder, book, wins, totals)
+    return builder.build()
+
+
+def _render_itemized(builder, book, wins):
+    kinds, amounts = book.kinds, book.amounts
+    players = book.players()
+
+    builder.line("<b>Ставки:</b>")
+    for owner, _, mention in players:
+        for i in book.positions(owner):
+            builder.line(_BET_LINE(mention, amounts[i], kind_display(kinds[i])), "<b>Ставки (продолжение):</b>")
+
+    builder.line("\n<b>Победители:</b>")
+    won_any = False
+    for owner, _, mention in players:
+        for i in book.positions(owner):
+            if wins[i]:
+                won_any = True
+                builder.line(_WIN_LINE(mention, wins[i], kind_display(kinds[i])), "<b>Победители (продолжение):</b>")
+    if not won_any:
+        builder.line("Никто не выиграл")
+
+
+def _render_rollup(builder, book, wins, totals):
+    kinds, amounts = book.kinds, book.amounts
+    details_left = DETAIL_LINES_LIMIT
+    details_skipped = 0
+
+    builder.line("<b>Итоги игроков:</b>")
+    for owner, _, mention in book.players():
+        # kind -> [ставок, поставлено, выиграно]
+        per_kind = {}
+        staked = 0
+        positions = book.positions(owner)
+        for i in positions:
+            row = per_kind.get(kinds[i])
+            if row is None:
+                row = per_kind[kinds[i]] = [0, 0, 0]
+            row[0] += 1
+            row[1] += amounts[i]
+            row[2] += wins[i]
+            staked += amounts[i]
+
+        count = len(positions)
+        if totals[owner]:
+            line = _PLAYER_LINE(mention, count, bets_word(count), fmt_amount(staked), fmt_amount(totals[owner]))
+        else:
+            line = _PLAYER_LOSS_LINE(mention, count, bets_word(count), fmt_amount(staked))
+        builder.line(line, "<b>Итоги (продолжение):</b>")
+
+        # Детализация - только выигравшие виды ставок и не больше общего лимита строк
+        for kind, (n, kind_staked, kind_won) in sorted(per_kind.items(), key=lambda item: -item[1][2]):
+            if not kind_won:
+                break
+            if details_left <= 0:
+                details_skipped += 1
+                continue
+            details_left -= 1
+            builder.line(_DETAIL_LINE(kind_display(kind), n, fmt_amount(kind_staked), fmt_amount(kind_won)),
+                         "<b>Итоги (продолжение):</b>")
+
+    if details_skipped:
+        builder.line(f"<i>…и еще {details_skipped} строк детализации</i>")
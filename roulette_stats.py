@@ -0,0 +1,74 @@
+from collections import deque
+
+STATS_WINDOWS = (100, 1000)  # окна частот, спинов
+
+
+class ChatSpinStats:
+    """Счетчики одного чата, обновляются за O(1) на спин"""
+
+    __slots__ = ("spins", "recent", "counts", "last_seen", "run_color", "run_length", "best_run")
+
+    def __init__(self):
+        self.spins = 0
+        self.recent = deque(maxlen=max(STATS_WINDOWS))
+        self.counts = {window: [0] * 37 for window in STATS_WINDOWS}  # окно -> частоты чисел
+        self.last_seen = [None] * 37  # номер спина, на котором число выпало последний раз
+        self.run_color = None
+        self.run_length = 0
+        self.best_run = (None, 0)  # (цвет, длина) самой длинной серии
+
+    def record(self, win_number, win_color):
+        recent = self.recent
+        # Число, выпадающее из каждого окна, нужно взять до append (deque сам выкинет старейшее)
+        for window, counts in self.counts.items():
+            if len(recent) >= window:
+                counts[recent[-window]] -= 1
+            counts[win_number] += 1
+        recent.append(win_number)
+
+        self.spins += 1
+        self.last_seen[win_number] = self.spins
+
+        if win_color == self.run_color:
+            self.run_length += 1
+        else:
+            self.run_color, self.run_length = win_color, 1
+        if self.run_length > self.best_run[1]:
+            self.best_run = (self.run_color, self.run_length)
+
+    def window(self, window):
+        """(спинов в окне, частоты чисел)"""
+        return min(len(self.recent), window), self.counts[window]
+
+    def hot_cold(self, window, top: int = 3):
+        size, counts = self.window(window)
+        ranked = sorted(range(37), key=lambda n: (-counts[n], n))
+        return size, [(n, counts[n]) for n in ranked[:top]], [(n, counts[n]) for n in ranked[-top:][::-1]]
+
+    def sleepers(self, top: int = 3):
+        """Дольше всех не выпадавшие числа: (число, спинов назад или None - не выпадало вовсе)"""
+        def ago(n):
+            seen = self.last_seen[n]
+            return self.spins - seen if seen is not None else None
+
+        ranked = sorted(range(37), key=lambda n: (ago(n) is not None, -(ago(n) or 0), n))
+        return [(n, ago(n)) for n in ranked[:top]]
+
+
+class SpinStats:
+    """Горячие/холодные числа и серии цветов по всем чатам, целиком в памяти"""
+
+    def __init__(self):
+        self._chats = {}  # chat_id -> ChatSpinStats
+
+    def record(self, chat_id, win_number, win_color):
+        stats = self._chats.get(chat_id)
+        if stats is None:
+            stats = self._chats[chat_id] = ChatSpinStats()
+        stats.record(win_number, win_color)
+
+    def get(self, chat_id):
+        return self._chats.get(chat_id)
+
+    def clear(self):
+        self._chats.clear()
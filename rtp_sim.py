@@ -0,0 +1,225 @@
+"""Монте-Карло проверка RTP игр и бенчмарк расчета рулетки.
+
+Гоняет раунды через настоящие функции выплат (таблица рулетки, mines.get_multiplier,
+bask.basket_multiplier) и печатает RTP, разброс и хвостовой риск по каждому виду ставки.
+Работает без сети и без базы:
+
+    python rtp_sim.py                      # все игры, 1 000 000 раундов
+    python rtp_sim.py --game mines -n 200000 --bombs 10
+    python rtp_sim.py --export-mines mines.csv   # таблица множителей мин для аудита
+    python rtp_sim.py --check              # код 1, если точный RTP >= 100% или симуляция с ним расходится
+    python rtp_sim.py --bench              # скорость расчета раунда и разбора ставок
+"""
+import argparse
+import math
+import random
+import sys
+import time
+from math import comb
+
+import bask
+import mines
+from bet_parser import _parse, parse_bet_line
+from roulette_engine import (
+    PAYOUTS, KIND_RED, KIND_BLACK, BetBook, np, number_kind, range_kind, kind_display
+)
+
+BLOCK_ROUNDS = 1000  # хвостовой риск считается по блокам из стольких раундов
+CHECK_SIGMAS = 5  # допустимое расхождение симуляции с точным RTP, в стандартных ошибках
+
+ROULETTE_KINDS = [
+    KIND_RED, KIND_BLACK, number_kind(0), number_kind(17),
+    range_kind(1, 2), range_kind(1, 3), range_kind(1, 6), range_kind(1, 12), range_kind(1, 18),
+]
+
+
+class Result:
+    __slots__ = ("game", "bet_type", "rtp", "exact", "std", "stderr", "hit_rate", "var99")
+
+    def __init__(self, game, bet_type, payouts, bet, exact=None):
+        n = len(payouts)
+        returns = [p / bet for p in payouts] if np is None else np.asarray(payouts, dtype=np.float64) / bet
+        total = float(sum(returns))
+        self.game = game
+        self.bet_type = bet_type
+        self.rtp = total / n
+        self.exact = exact
+        self.std = math.sqrt(max(float(sum(r * r for r in returns)) / n - self.rtp ** 2, 0.0)) \
+            if np is None else float(returns.std())
+        self.stderr = self.std / math.sqrt(n)
+        self.hit_rate = sum(1 for p in payouts if p > 0) / n if np is None else float((returns > 0).mean())
+        self.var99 = _house_var99(returns, n)
+
+    def checked(self):
+        """Хватает ли раундов для вывода: разброс симуляции меньше запаса точного RTP до 100%.
+        Без точного RTP проверять нечего, кроме самой симуляции"""
+        return self.exact is None or CHECK_SIGMAS * self.stderr < 1 - self.exact
+
+    def ok(self):
+        if self.exact is None:
+            # Точного значения нет - симуляция должна уверенно показать RTP ниже 100%
+            return self.rtp + CHECK_SIGMAS * self.stderr < 1
+        if self.exact >= 1:
+            return False
+        if not self.checked():
+            return True  # редкие стратегии при таком числе раундов - шум, а не сигнал
+        return abs(self.rtp - self.exact) <= CHECK_SIGMAS * max(self.stderr, 1e-9)
+
+
+def _house_var99(returns, n):
+    """Худший 1% результата казино за блок из BLOCK_ROUNDS раундов, в ставках (минус - казино в убытке)"""
+    blocks = n // BLOCK_ROUNDS
+    if blocks < 2:
+        return None
+    if np is not None:
+        sums = returns[:blocks * BLOCK_ROUNDS].reshape(blocks, BLOCK_ROUNDS).sum(axis=1)
+        house = np.sort(BLOCK_ROUNDS - sums)
+    else:
+        house = sorted(BLOCK_ROUNDS - sum(returns[i:i + BLOCK_ROUNDS]) for i in range(0, blocks * BLOCK_ROUNDS, BLOCK_ROUNDS))
+    return float(house[int(blocks * 0.01)])
+
+
+# --- РУЛЕТКА ---
+
+def simulate_roulette(rounds, bet, rng):
+    if np is not None:
+        outcomes = np.random.default_rng(rng.getrandbits(64)).integers(0, 37, rounds)
+    else:
+        outcomes = [rng.randrange(37) for _ in range(rounds)]
+
+    results = []
+    for kind in ROULETTE_KINDS:
+        # Ровно как в settle: int(ставка * множитель) по столбцу выпавшего числа
+        column = [int(bet * PAYOUTS[kind][n]) for n in range(37)]
+        payouts = np.asarray(column)[outcomes] if np is not None else [column[n] for n in outcomes]
+        exact = sum(column) / 37 / bet
+        results.append(Result("рулетка", kind_display(kind), payouts, bet, exact))
+    return results
+
+
+# --- МИНЫ ---
+
+def _mines_survival(hits, bombs=mines.BOMBS_COUNT):
+    return comb(25 - bombs, hits) / comb(25, hits)
+
+
+def simulate_mines(rounds, bet, rng, bombs=mines.BOMBS_COUNT):
+    """Стратегия «забрать после k открытых клеток» для каждого k.
+
+    Одна раскладка на раунд обслуживает все стратегии: игрок открывает клетки в случайном
+    порядке, k клеток пережиты, если первая бомба в этом порядке стоит не раньше позиции k.
+    """
+    safe = 25 - bombs
+    if np is not None:
+        gen = np.random.default_rng(rng.getrandbits(64))
+        order = np.argsort(gen.random((rounds, 25)), axis=1)
+        first_bomb = (order < bombs).argmax(axis=1)
+    else:
+        first_bomb = []
+        for _ in range(rounds):
+            board = set(rng.sample(range(25), bombs))
+            clicks = rng.sample(range(25), 25)
+            first_bomb.append(next(i for i, cell in enumerate(clicks) if cell in board))
+
+    results = []
+    for hits in range(1, safe + 1):
+        win = int(bet * mines.get_multiplier(hits, bombs))
+        payouts = np.where(first_bomb >= hits, win, 0) if np is not None else \
+            [win if pos >= hits else 0 for pos in first_bomb]
+        exact = _mines_survival(hits, bombs) * win / bet
+        results.append(Result("мины", f"{bombs}💣 забрать после {hits}", payouts, bet, exact))
+    return results
+
+
+# --- БАСКЕТ ---
+
+def simulate_basket(rounds, bet, rng):
+    # Кубик Telegram 🏀 выдает 1-5 равновероятно
+    payouts = [int(bet * bask.basket_multiplier(rng.randint(1, 5), rng)) for _ in range(rounds)]
+    return [Result("баскет", "бросок", payouts, bet)]
+
+
+GAMES = {
+    "roulette": simulate_roulette,
+    "mines": simulate_mines,
+    "basket": simulate_basket,
+}
+
+
+def print_report(results):
+    print(f"{'игра':<8} {'ставка':<20} {'RTP':>8} {'точный':>8} {'σ':>7} {'попадания':>10} {'VaR99/' + str(BLOCK_ROUNDS):>12}")
+    for r in results:
+        exact = f"{r.exact:.4f}" if r.exact is not None else "-"
+        var99 = f"{r.var99:.1f}" if r.var99 is not None else "-"
+        flag = "  <-- !" if not r.ok() else ("" if r.checked() else "  (не проверено: мало раундов)")
+        print(f"{r.game:<8} {r.bet_type:<20} {r.rtp:>8.4f} {exact:>8} {r.std:>7.3f} {r.hit_rate:>10.4f} {var99:>12}{flag}")
+
+
+# --- БЕНЧМАРК ---
+
+def bench(rng, players=200, bets_per_player=100, repeats=20):
+    book = BetBook()
+    kinds = list(range(len(PAYOUTS)))
+    for user_id in range(players):
+        book.add(user_id, "", [(rng.choice(kinds), rng.randint(1, 10_000)) for _ in range(bets_per_player)])
+
+    start = time.perf_counter()
+    for i in range(repeats):
+        book.settle(i % 37)
+    elapsed = (time.perf_counter() - start) / repeats
+    print(f"расчет раунда: {len(book)} ставок за {elapsed * 1000:.2f} мс "
+          f"({len(book) / elapsed:,.0f} ставок/с, numpy: {'да' if np is not None else 'нет'})")
+
+    # Спам ставками - это в основном повторы одних и тех же строк
+    pool = [f"{rng.randint(1, 1000)} к 1-12 7/17/27 {rng.randint(1, 36)} x2" for _ in range(200)]
+    lines = [rng.choice(pool) for _ in range(10_000)]
+    start = time.perf_counter()
+    for line in lines:
+        _parse.__wrapped__(line.lower())
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    for line in lines:
+        parse_bet_line(line)
+    warm = time.perf_counter() - start
+    print(f"разбор ставок: {len(lines) / cold:,.0f} строк/с без кэша, {len(lines) / warm:,.0f} строк/с с кэшем")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Монте-Карло RTP игр и бенчмарк расчета")
+    parser.add_argument("--game", choices=[*GAMES, "all"], default="all")
+    parser.add_argument("-n", "--rounds", type=int, default=1_000_000)
+    parser.add_argument("--bet", type=int, default=1000, help="ставка: выплаты округляются вниз, как в игре")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--check", action="store_true", help="код возврата 1 при RTP >= 100%% или расхождении")
+    parser.add_argument("--bench", action="store_true", help="только бенчмарк расчета и разбора ставок")
+    parser.add_argument("--bombs", type=int, default=mines.BOMBS_COUNT,
+                        choices=range(mines.MIN_BOMBS, mines.MAX_BOMBS + 1), metavar="1-24",
+                        help="бомб на поле для симуляции мин")
+    parser.add_argument("--export-mines", metavar="PATH", help="выгрузить таблицу множителей мин в CSV и выйти")
+    args = parser.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    if args.bench:
+        bench(rng)
+        return 0
+    if args.export_mines:
+        with open(args.export_mines, "w", newline="", encoding="utf-8") as fp:
+            mines.export_multiplier_table(fp)
+        return 0
+
+    results = []
+    for name, simulate in GAMES.items():
+        if args.game in (name, "all"):
+            started = time.perf_counter()
+            extra = {"bombs": args.bombs} if simulate is simulate_mines else {}
+            results.extend(simulate(args.rounds, args.bet, rng, **extra))
+            print(f"{name}: {args.rounds:,} раундов за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+    print_report(results)
+    if args.check and not all(r.ok() for r in results):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
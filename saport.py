@@ -6,8 +6,8 @@ from aiogram import Router, F
 from aiogram.types import (Message, LabeledPrice, PreCheckoutQuery)
 from aiogram.filters import Command
 from database import (get_user_data, get_currency_symbol, check_user,
-                      DB_PATH, get_emoji_by_slot, get_history, add_balance, add_donation)
-import aiosqlite
+                      pool, get_emoji_by_slot, get_history, add_balance, add_donation,
+                      count_bonus_ready, get_transfers_stats)
 
 router = Router()
 
@@ -19,7 +19,7 @@ def get_mention(user_id, name):
 
 
 async def get_stats():
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with pool.read() as db:
         async with db.execute("SELECT COUNT(*) FROM users WHERE is_banned = 0") as c:
             active = (await c.fetchone())[0]
         async with db.execute("SELECT COUNT(*) FROM users WHERE is_banned = 1") as c:
@@ -70,6 +70,8 @@ async def start_handler(message: Message):
 @router.message(Command("stats"))
 async def cmd_stats(message: Message):
     active, banned = await get_stats()
+    bonus_ready = await count_bonus_ready()
+    transfers_count, transfers_sum = await get_transfers_stats(3600)
     emoji_title = await format_emoji(2)
     emoji_active = await format_emoji(3)
     emoji_banned = await format_emoji(4)
@@ -77,7 +79,9 @@ async def cmd_stats(message: Message):
     txt = (
         f"{emoji_title} <b>Статистика:</b>\n"
         f"{emoji_active} Активных: <b>{active}</b>\n"
-        f"{emoji_banned} В бане: <b>{banned}</b>"
+        f"{emoji_banned} В бане: <b>{banned}</b>\n"
+        f"🎁 Могут взять бонус: <b>{bonus_ready}</b>\n"
+        f"💸 Переводов за час: <b>{transfers_count}</b> на {transfers_sum:,} cron".replace(',', ' ')
     )
     await message.answer(txt, parse_mode="HTML")
 
@@ -108,7 +112,7 @@ async def cmd_history(message: Message):
     lines = [f"📝 <b>История переводов {mention}:</b>"]
     for row in history[:15]:  # Ограничим 15 записями для чистоты
         amount = f"{row['amount']:,}".replace(',', ' ')
-        time = row['timestamp']
+        time = datetime.fromtimestamp(row['timestamp']).strftime("%d.%m.%Y %H:%M") if row['timestamp'] else "?"
         if row['from_user_id'] == user_id:
             target = get_mention(row['to_user_id'], row['to_user_name'])
             lines.append(f"➖ <code>{amount}</code> ➔ {target} | <small>{time}</small>")
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import time
+
+SWEEP_INTERVAL = 60  # секунд между проходами чистильщика
+
+
+class SessionRegistry:
+    """Живые сессии одной игры: ключ -> время последней активности.
+
+    store и locks - словари самой игры (состояние и замки по тому же ключу).
+    Сессии, не тронутые дольше ttl, чистильщик выселяет из обоих словарей;
+    если задан on_expire(bot, key), он вызывается раньше (забрать выигрыш, вернуть ставку).
+    """
+
+    def __init__(self, name, ttl, store=None, locks=None, on_expire=None):
+        self.name = name
+        self.ttl = ttl
+        self.store = store
+        self.locks = locks
+        self.on_expire = on_expire
+        self._seen = {}
+
+    def touch(self, key):
+        self._seen[key] = time.monotonic()
+
+    def lock(self, key) -> asyncio.Lock:
+        """Замок сессии с отметкой активности - вместо locks.setdefault(key, asyncio.Lock())"""
+        self._seen[key] = time.monotonic()
+        lock = self.locks.get(key)
+        if lock is None:
+            lock = self.locks[key] = asyncio.Lock()
+        return lock
+
+    def gauge(self):
+        """(сессий, замков) прямо сейчас"""
+        return (len(self.store) if self.store is not None else 0,
+                len(self.locks) if self.locks is not None else 0)
+
+    def _stale(self, key, now):
+        seen = self._seen.get(key)
+        return seen is None or now - seen >= self.ttl
+
+    async def sweep(self, bot):
+        now = time.monotonic()
+        # Ключи, появившиеся в обход touch, начинают отсчет с первого прохода
+        for source in (self.store, self.locks):
+            if source is not None:
+                for key in source:
+                    self._seen.setdefault(key, now)
+
+        evicted = 0
+        for key in [key for key, seen in self._seen.items() if now - seen >= self.ttl]:
+            if self.on_expire is not None and self.store is not None and key in self.store:
+                try:
+                    await self.on_expire(bot, key)
+                except Exception as e:
+                    logging.error(f"Сессии {self.name}: не удалось закрыть {key}: {e}")
+                    continue
+            # Пока ждали on_expire, сессию могли снова тронуть или занять
+            lock = self.locks.get(key) if self.locks is not None else None
+            if not self._stale(key, time.monotonic()) or (lock is not None and lock.locked()):
+                continue
+            self._seen.pop(key, None)
+            removed = self.store is not None and self.store.pop(key, None) is not None
+            removed = (self.locks is not None and self.locks.pop(key, None) is not None) or removed
+            evicted += removed
+        return evicted
+
+
+registries = []
+
+
+def register(name, ttl, store=None, locks=None, on_expire=None) -> SessionRegistry:
+    registry = SessionRegistry(name, ttl, store, locks, on_expire)
+    registries.append(registry)
+    return registry
+
+
+def session_gauges():
+    """{игра: (сессий, замков)} по всем зарегистрированным играм"""
+    return {registry.name: registry.gauge() for registry in registries}
+
+
+async def sweep_sessions(bot=None):
+    """Проход чистильщика по всем играм; вызывается планировщиком раз в SWEEP_INTERVAL"""
+    evicted = {}
+    for registry in registries:
+        count = await registry.sweep(bot)
+        if count:
+            evicted[registry.name] = count
+    if evicted:
+        gauges = ", ".join(f"{name} {live}" for name, (live, _) in session_gauges().items())
+        logging.info(f"Сессии: выселено {evicted}; живых: {gauges}")
+    return evicted
@@ -2,8 +2,7 @@ import logging
 from aiogram import Router, F
 from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.filters import CommandStart
-from database import check_user, get_user_data, get_emoji_by_slot  # Добавили импорт
-import aiosqlite
+from database import check_user, update_user_names, get_emoji_by_slot  # Добавили импорт
 
 router = Router()
 
@@ -32,19 +31,14 @@ def get_start_inline(bot_username):
 @router.message(CommandStart(), F.chat.type == "private")
 async def start_cmd(message: Message):
     user_id = message.from_user.id
-    username = f"@{message.from_user.username}" if message.from_user.username else "Нет"
+    # Юзернейм храним как есть (без @), как и мидлварь - иначе поиск по нему не сработает
+    username = message.from_user.username
     full_name = message.from_user.full_name
 
     # 1. Регистрация
     await check_user(user_id, username, full_name)
 
-    from database import DB_PATH
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute(
-            "UPDATE users SET username = ?, full_name = ? WHERE user_id = ?",
-            (username, full_name, user_id)
-        )
-        await db.commit()
+    await update_user_names(user_id, username, full_name)
 
     # 2. Получаем данные для дизайна
     bot_info = await message.bot.get_me()
@@ -0,0 +1,16 @@
+import pytest
+
+from bet_parser import parse_bet_line
+from roulette_engine import KIND_RED
+
+
+def test_parses_simple_bet():
+    bets, truncated = parse_bet_line("500 к")
+    assert bets == ((KIND_RED, 500),)
+    assert not truncated
+
+
+@pytest.mark.parametrize("text", ["5² к", "٣ к", "500 ٣"])
+def test_non_ascii_digits_are_not_bets(text):
+    # str.isdigit() и \d пропускают такие цифры, а int() на "5²" падает с ValueError
+    assert parse_bet_line(text) is None